@@ -1,17 +1,110 @@
 
 xver = '1.B.4'
+import time
+T_START = time.perf_counter()
 import os
-import openpyxl
-from datetime import datetime
-from astropy.time import Time
-
-SEC_WEEK    = (7*24*60*60)
+import sys
+import csv
+import struct
+import hashlib
+import importlib
+import contextlib
+import itertools
+from array import array
+from collections import deque
+from bisect import bisect_right
+from datetime import datetime, date, timedelta
+
+SEC_DAY     = (24*60*60)
+SEC_WEEK    = (7*SEC_DAY)
 GPS_MODE    = 1024
 GPS_BYEAR   = 1980
 BASE_DAY    = 1
 BASE_MONTH  = 1
 BASE_YEAR   = 2020
 BASE_WEEK   = ((BASE_YEAR-GPS_BYEAR)*52+BASE_MONTH*4+BASE_DAY/7)
+GPS_BDATE   = date(GPS_BYEAR,1,6)
+
+# leap seconds: (UTC date, GPS-UTC seconds from that date)
+# add the new one here when IERS announces it
+GPS_LEAP_List = [((1981,7,1), 1)
+                ,((1982,7,1), 2)
+                ,((1983,7,1), 3)
+                ,((1985,7,1), 4)
+                ,((1988,1,1), 5)
+                ,((1990,1,1), 6)
+                ,((1991,1,1), 7)
+                ,((1992,7,1), 8)
+                ,((1993,7,1), 9)
+                ,((1994,7,1),10)
+                ,((1996,1,1),11)
+                ,((1997,7,1),12)
+                ,((1999,1,1),13)
+                ,((2006,1,1),14)
+                ,((2009,1,1),15)
+                ,((2012,7,1),16)
+                ,((2015,7,1),17)
+                ,((2017,1,1),18)]
+# GPS seconds (from GPS_BDATE) when each leap second takes effect
+GPS_LEAP_SEC = [(date(*d)-GPS_BDATE).days*SEC_DAY+n for d, n in GPS_LEAP_List]
+
+# xlsx (openpyxl) file extensions, the others are read as the xlx text export
+XLSX_EXT    = ('.xlsx', '.xlsm')
+# xlx: the delimiter is the one found most in the title line
+XLX_DELIMITER = ('\t', ',', ';')
+XLX_NA      = ('', '=NA()', '#N/A')
+# xlx read buffer (bytes), big reads for the network drives and the pipeline reader thread
+XLX_READ_BUF = 1024*1024
+# the window start search (see XlxSht.seekTime) goes on reading the rows from this size (bytes)
+XLX_SEEK_MIN = 64*1024
+# the GNSS rows are read from/to this time (sec) before/after the window
+WINDOW_GNSS_MARGIN = 1.0
+
+# parsed xlsx/xlx cache: <file>.x2n, rows per block
+CACHE_EXT   = '.x2n'
+CACHE_VER   = 2
+# NA cells of the int/float cache columns: code (1, 2, ...) of the cell value, so they come back the same
+CACHE_NA    = (None, '=NA()', '#N/A')
+CACHE_BLOCK_ROW = 4096
+
+# column layout cache (see getLayout): file ('' for none), layouts kept
+LAYOUT_CACHE = os.path.join(os.path.expanduser('~'), '.xlx2nmea', 'layout.cache')
+LAYOUT_CACHE_MAX = 64
+
+# rows converted together (UTC time, etc.)
+CHUNK_ROW   = 1024
+# DR and GNSS rows are matched when the GPS time is within (sec)
+ALIGN_TOL   = 0.0005
+# TimeAlign.match(): the GNSS rows are over, the DR row is held
+ALIGN_HOLD  = ()
+
+# incremental mode: checkpoint file (<NMEA file>.ckpt, JSON)
+CKPT_EXT    = '.ckpt'
+CKPT_VER    = 1
+
+# conversion profile stages (see ConvProfile), seconds between the progress lines
+PROF_STAGE_List = ['load', 'index', 'align', 'columns', 'utc', 'pos', 'GGA', 'RMC', 'GSV/GSA', 'write']
+PROGRESS_SEC = 0.5
+
+# NMEA replay over TCP (see NmeaReplay): address, rows queued for the replay/each client
+REPLAY_HOST = '127.0.0.1'
+REPLAY_PORT = 10110
+REPLAY_QUEUE = 64
+REPLAY_CLIENT_QUEUE = 256
+REPLAY_EOL  = b'\r\n'
+
+# batch mode summary file, in the output directory
+BATCH_SUMMARY = 'batch-summary.csv'
+
+# NMEA output: write buffer size (bytes), compress ('', 'gz', 'xz')
+WR_BUF_SIZE = 4*1024*1024
+NMEA_COMPRESS = ''
+NMEA_COMPRESS_List = {''  : open,
+                      'gz': lambda p, m: lazyImport('gzip').open(p, m, compresslevel=6),
+                      'xz': lambda p, m: lazyImport('lzma').open(p, m)}
+
+# import time (sec): the script itself, and the modules imported on demand (see lazyImport)
+IMPORT_TIME = {}
 
 DR_GNSS_LINE= 3
 GGA_1_DR    = 'Time of Week (sec GPS)'
@@ -45,6 +138,7 @@ CNO_NAME_List = ['L1'
                 ,'B1'
                 ,'B2A'
                 ,'B2I']
+CNO_NAME_Index = {n: i for i, n in enumerate(CNO_NAME_List)}
 
 GSA_2_GNSS  = 'Fix Type'
 GSA_4_GNSS  = 'PDOP'
@@ -67,58 +161,627 @@ MAX_SVNUM_LINE= 3
 
 # sv number, elev, amiz, cno1 value, cno1, cno2 value, cno2
 GSV_SUBELEM_NUM=7
-# sv number, sv used col location, CNO1 name index, CNO2 name index
-GSV_LIST_SUBELEM_NUM = 4
+
+# sharded NMEA output (see ShardWriter): manifest file (<NMEA file name>.manifest.json),
+# threads writing/compressing the shards
+SHARD_MANIFEST = '.manifest.json'
+SHARD_VER   = 1
+SHARD_WRITERS = 4
+
+# pipeline mode (see threadIter/PipeWriter): row chunks read ahead, NMEA blocks queued for the writer
+PIPE_QUEUE  = 4
+PIPE_WR_QUEUE = 16
 
 # debug output
 DBG_PRT = 0
 
-def GenChkSum(Msg,cm):
+# NMEA line end, the same as the text mode file
+NMEA_EOL = os.linesep.encode('utf-8')
+
+# decimals of the lat/lon minutes (ddmm.mmmmmmmm), the same as the rounding before
+NMEA_POS_DEC = 8
+
+# NMEA checksum in hex
+HEX_List = [b'%02X' % i for i in range(256)]
+
+def lazyImport(name):
+    # the heavy modules (openpyxl, etc.) are only imported when a conversion needs them
+    mod = sys.modules.get(name)
+    if mod is None:
+        t = time.perf_counter()
+        mod = importlib.import_module(name)
+        IMPORT_TIME[name] = time.perf_counter() - t
+    return mod
+
+def startupReport():
+    print('startup time:')
+    for name, t in IMPORT_TIME.items():
+        print(f'  {name}: {round(t*1000,1)} ms')
+
+def GenChkSum(Msg):
+    # XOR of all the bytes between '$' and '*'
     cs = 0
     for i in Msg:
         cs ^= i
-    if not cm:
-        cs ^= 0x2C # hex of ','
-    return (0xFF&cs)
+    return cs
 
 def GenNMEAMsg(*itemList):
-    l = len(itemList)
-    if not l:
-        return ''
+    # -> sentence in bytes: [time_tag]$item,item,...*hh
+    if len(itemList) < 3:
+        return b''
 
     dbg_flag = itemList[0]
     time_tag = itemList[1]
-    
-    msg = ''
+
     # skip the dbg_flag and time_tag
-    l -= 2
-    for i in range(l):
-        msg += itemList[2+i]
+    msg = ','.join(itemList[2:]).encode('utf-8')
+    return b''.join((str(time_tag).encode('utf-8') if dbg_flag else b'',
+                     b'$', msg, b'*', HEX_List[GenChkSum(msg)]))
 
-    cs = GenChkSum(bytes(msg,'utf-8'), l%2)
-    cs = hex(cs).upper()
-    cs = str(cs)[2:].zfill(2)
+class RowWindow:
+    """
+    GPS time window and output rate of the rows, checked by the readers
+    before the row is parsed (see XlxSht.rows)
+
+    start/end: (week, time of week), the week None: the week of the first row
+    rate: rows per second (the first row from each 1/rate sec), 0 for all the rows
+    week_col/tow_col: the time columns
+    count_rows: the row numbers are exact after XlxSht jumps to the start (incremental
+    checkpoint, debug), else they are estimated from the line length (progress line)
+    """
+    def __init__(self, week_col, tow_col, start=None, end=None, rate=0):
+        self.week_col = week_col
+        self.tow_col = tow_col
+        self.start_in = start
+        self.end_in = end
+        # in ms, see resolve()
+        self.start = self.end = None
+        self.resolved = start is None and end is None
+        self.tick = round(1000/rate) if rate else 0
+        self.next = None
+        self.count_rows = False
+
+    def time(self, week, tow):
+        # GPS time in ms, None when there is no time
+        if isNA(week) or isNA(tow):
+            return None
+        try:
+            return int(week)*SEC_WEEK*1000 + round(float(tow)*1000)
+        except (TypeError, ValueError):
+            return None
+
+    def resolve(self, week):
+        # the week of start/end when it's not given
+        if self.resolved or isNA(week):
+            return
+        self.resolved = True
+        if self.start_in:
+            self.start = self.time(week if self.start_in[0] is None else self.start_in[0], self.start_in[1])
+        if self.end_in:
+            self.end = self.time(week if self.end_in[0] is None else self.end_in[0], self.end_in[1])
+
+    def check(self, week, tow):
+        # -> 1: keep the row, 0: skip it, None: after the end (no need to read on)
+        t = self.time(week, tow)
+        if t is None:
+            return 0
+        if not self.resolved:
+            self.resolve(week)
+        if self.start is not None and t < self.start:
+            return 0
+        if self.end is not None and t > self.end:
+            return None
+        if self.tick:
+            if self.next is not None and t < self.next:
+                return 0
+            self.next = (t//self.tick + 1)*self.tick
+        return 1
+
+    def seed(self, week, tow):
+        # incremental mode: the last row kept by the run before
+        t = self.time(week, tow)
+        if t is not None:
+            self.resolve(week)
+            if self.tick:
+                self.next = (t//self.tick + 1)*self.tick
+
+def parseGPSTime(v):
+    # 'week:time of week' or 'time of week' (the week of the log) -> (week, time of week), None for None/''
+    if v is None or v == '':
+        return None
+    if isinstance(v, (tuple, list)):
+        return (v[0], float(v[1]))
+    week, _, tow = str(v).rpartition(':')
+    return (int(week) if week else None, float(tow))
+
+class XlsxSht:
+    """
+    read only (streaming) view of the first sheet in a XLSX file
 
-    if dbg_flag:
-        msg = str(time_tag)
-    else:
-        msg = ''
+    rows are parsed in order straight from the sheet XML, so the memory
+    only holds the current row instead of the whole cell tree
+    every row is a tuple: (row number, column 1, column 2, ...),
+    then the openpyxl column index can be used on it directly
+    """
+    def __init__(self, p):
+        self.wb = lazyImport('openpyxl').load_workbook(p, read_only=True)
+        self.sht = self.wb[self.wb.sheetnames[0]]
+        title = next(self.sht.iter_rows(min_row=1, max_row=1, values_only=True), ())
+        self.max_column = max(self.sht.max_column or 0, len(title))
+        # max_row comes from the sheet dimension, it may be missing
+        self.max_row = self.sht.max_row
+        # the SV title check may look a few columns after the last one
+        self.title = self.pad((1,) + tuple(title)) + (None,)*3
+        self.index = getTitleIndex(self.title, self.max_column)
+
+    def pad(self, row):
+        if len(row) <= self.max_column:
+            row += (None,)*(self.max_column + 1 - len(row))
+        return row
+
+    def useColumns(self, cols):
+        # openpyxl parses the whole row anyway
+        pass
+
+    def rows(self, min_row=2, max_row=None, window=None):
+        # window: only the rows in the RowWindow
+        row_num = min_row
+        for row in self.sht.iter_rows(min_row=min_row, max_row=max_row, values_only=True):
+            vals = self.pad((row_num,) + tuple(row))
+            row_num += 1
+            if window:
+                keep = window.check(vals[window.week_col], vals[window.tow_col])
+                if keep is None:
+                    break
+                if not keep:
+                    continue
+            yield vals
 
-    # skip the dbg_flag and time_tag
-    for i in range(l):
-        if not i:
-            msg += '$' + itemList[2+i]
-        else:
-            msg += ',' + itemList[2+i]
-    
-    return msg + '*' + cs
+    def close(self):
+        self.wb.close()
+
+class XlxSht:
+    """
+    Trimble xlx export (delimited text), the same interface as XlsxSht
+
+    no need to save it as xlsx first, the rows are parsed while streaming
+    '=NA()'/'#N/A'/empty cells are None (NA), the numbers are int/float
+    only the columns set by useColumns() are parsed (all by default)
+    """
+    def __init__(self, p):
+        self.p = p
+        with open(p, 'rt', encoding='utf-8-sig', errors='replace', newline='') as f:
+            line = f.readline()
+        self.delimiter = max(XLX_DELIMITER, key=line.count)
+        title = [xlxValue(t) for t in next(csv.reader([line], delimiter=self.delimiter), [])]
+        self.max_column = len(title)
+        # unknown until the whole file is read
+        self.max_row = None
+        # the SV title check may look a few columns after the last one
+        self.title = (1,) + tuple(title) + (None,)*3
+        self.index = getTitleIndex(self.title, self.max_column)
+        self.cols = range(1, self.max_column+1)
+
+    def useColumns(self, cols):
+        self.cols = sorted(c for c in set(cols) if 0 < c <= self.max_column)
+
+    def rows(self, min_row=2, max_row=None, window=None):
+        # window: only the rows in the RowWindow, the others are not parsed
+        width = self.max_column + 1
+        cols = self.cols
+        offset = row_num = 0
+        if window and min_row <= 2:
+            offset, row_num = self.seekTime(window)
+        with open(self.p, 'rt', encoding='utf-8-sig', errors='replace', newline='', buffering=XLX_READ_BUF) as f:
+            if offset:
+                f.seek(offset)
+            else:
+                # the rows before min_row are skipped without parsing
+                for row_num, _ in zip(range(1, min_row), f):
+                    pass
+            if window:
+                wc = window.week_col - 1
+                tc = window.tow_col - 1
+                tl = max(wc, tc)
+            for cells in csv.reader(f, delimiter=self.delimiter):
+                row_num += 1
+                if row_num < min_row:
+                    continue
+                if max_row and row_num > max_row:
+                    break
+                if window:
+                    if len(cells) <= tl:
+                        continue
+                    keep = window.check(xlxValue(cells[wc]), xlxValue(cells[tc]))
+                    if keep is None:
+                        break
+                    if not keep:
+                        continue
+                vals = [None]*width
+                vals[0] = row_num
+                l = len(cells)
+                for c in cols:
+                    if c <= l:
+                        vals[c] = xlxValue(cells[c-1])
+                yield tuple(vals)
+
+    def seekTime(self, window):
+        """
+        binary search of the window start (the rows are in time order)
+        -> (file offset of a row before the start, rows before it), (0, 0) for no start
+        the rows before it are only counted for window.count_rows, else estimated
+        """
+        with open(self.p, 'rb') as f:
+            f.readline()
+            lo = head = f.tell()
+            line = f.readline()
+            t = self.lineTime(line, window, True)
+            if t is None or window.start is None:
+                return 0, 0
+            # bytes/lines read, for the row number estimate
+            line_b, line_n = len(line), 1
+            hi = os.fstat(f.fileno()).st_size
+            while hi - lo > XLX_SEEK_MIN:
+                mid = (lo + hi)//2
+                f.seek(mid)
+                f.readline()
+                pos = f.tell()
+                # the first row with the time after mid
+                t = None
+                while t is None and f.tell() < hi:
+                    line = f.readline()
+                    line_b += len(line)
+                    line_n += 1
+                    t = self.lineTime(line, window)
+                if t is None or t >= window.start:
+                    hi = mid
+                else:
+                    lo = pos
+            if not window.count_rows:
+                return lo, 1 + round((lo - head)*line_n/line_b)
+            # the row number: lines before lo, no need to parse them
+            f.seek(0)
+            n = 0
+            left = lo
+            while left > 0:
+                b = f.read(min(left, 1024*1024))
+                if not b:
+                    break
+                n += b.count(b'\n')
+                left -= len(b)
+        return lo, n
+
+    def lineTime(self, line, window, first=False):
+        # GPS time (ms) of a row in bytes, first: the window gets the week from it
+        cells = next(csv.reader([line.decode('utf-8', 'replace')], delimiter=self.delimiter), [])
+        if len(cells) < max(window.week_col, window.tow_col):
+            return None
+        week = xlxValue(cells[window.week_col-1])
+        tow = xlxValue(cells[window.tow_col-1])
+        if first:
+            window.resolve(week)
+        return window.time(week, tow)
+
+    def close(self):
+        pass
+
+def xlxValue(v):
+    v = v.strip()
+    if v in XLX_NA:
+        return None
+    try:
+        return int(v)
+    except ValueError:
+        pass
+    try:
+        return float(v)
+    except ValueError:
+        return v
+
+class CacheSht:
+    """
+    columnar cache of a parsed xlsx/xlx (<file>.x2n), the same interface as XlsxSht
+
+    file: [meta position, 8 bytes] [row block] ... [meta, JSON]
+    row block: [first row, rows, bytes after this header: CACHE_BLOCK_HEAD] [column] ...
+    column: [type, data bytes, NA bytes: CACHE_COL_HEAD] [data] [NA], see cacheCol()
+    meta: CACHE_VER, the source size/mtime and content hash, title, max_row
+    no pickle: the cache is next to the log (network share), it's only read as data
+    """
+    def __init__(self, cache_p, meta):
+        self.p = cache_p
+        self.max_column = meta['max_column']
+        self.max_row = meta['max_row']
+        self.title = meta['title']
+        self.index = getTitleIndex(self.title, self.max_column)
+
+    def useColumns(self, cols):
+        # the whole block is read anyway
+        pass
+
+    def rows(self, min_row=2, max_row=None, window=None):
+        # window: only the rows in the RowWindow, the others are not made into rows
+        with open(self.p, 'rb') as f:
+            meta_pos = int.from_bytes(f.read(8), 'little')
+            while f.tell() < meta_pos:
+                first, n, size = CACHE_BLOCK_HEAD.unpack(f.read(CACHE_BLOCK_HEAD.size))
+                if first + n <= min_row:
+                    f.seek(size, 1)
+                    continue
+                if max_row and first > max_row:
+                    break
+                cols = cacheBlockCols(f.read(size))
+                if window:
+                    # only the time columns, then the rows kept
+                    keep = self.windowRows(first, n, cols, min_row, max_row, window)
+                    vals_list = [cacheColVals(c) for c in cols] if keep else ()
+                    for i in keep:
+                        if i is None:
+                            return
+                        yield (first+i,) + tuple(v[i] for v in vals_list)
+                    continue
+                for vals in zip(range(first, first+n), *[cacheColVals(c) for c in cols]):
+                    if vals[0] < min_row:
+                        continue
+                    if max_row and vals[0] > max_row:
+                        return
+                    yield vals
+
+    def windowRows(self, first, n, cols, min_row, max_row, window):
+        # block rows in the window: [index, ...], None at the end when the window is over
+        weeks = cacheColVals(cols[window.week_col-1])
+        tows = cacheColVals(cols[window.tow_col-1])
+        keep = []
+        for i in range(n):
+            if first+i < min_row:
+                continue
+            if max_row and first+i > max_row:
+                keep.append(None)
+                break
+            k = window.check(weeks[i], tows[i])
+            if k is None:
+                keep.append(None)
+                break
+            if k:
+                keep.append(i)
+        return keep
+
+    def close(self):
+        pass
+
+# cache file: row block header (first row, rows, bytes), column header (type, data bytes, NA bytes)
+CACHE_BLOCK_HEAD = struct.Struct('<IIQ')
+CACHE_COL_HEAD = struct.Struct('<cII')
+
+def cacheCol(vals):
+    """
+    int/float column -> (array type, array bytes (little endian), NA code of each row (see CACHE_NA), b'': none)
+    the others -> ('o', JSON of the values, b''), the cell values as they are
+    """
+    na = bytearray(CACHE_NA.index(v) + 1 if isNA(v) else 0 for v in vals)
+    kinds = {type(v) for v, n in zip(vals, na) if not n}
+    t = 'q' if kinds == {int} else 'd' if kinds == {float} else ''
+    if t:
+        try:
+            col = array(t, [0 if n else v for v, n in zip(vals, na)])
+            if sys.byteorder != 'little':
+                col.byteswap()
+            return (t, col.tobytes(), bytes(na) if any(na) else b'')
+        except OverflowError:
+            pass
+    return ('o', lazyImport('json').dumps(vals, default=cacheJSON).encode('utf-8'), b'')
+
+def cacheJSON(v):
+    # the cell values JSON has not: date/time (openpyxl), the others as text
+    if type(v).__name__ in ('datetime', 'date', 'time'):
+        return {'$' + type(v).__name__: v.isoformat()}
+    if isinstance(v, timedelta):
+        return {'$timedelta': v.total_seconds()}
+    return str(v)
+
+def cacheJSONValue(d):
+    if len(d) == 1:
+        k, v = next(iter(d.items()))
+        if k == '$datetime':
+            return datetime.fromisoformat(v)
+        if k == '$date':
+            return date.fromisoformat(v)
+        if k == '$time':
+            return datetime.fromisoformat('1900-01-01T' + v).time()
+        if k == '$timedelta':
+            return timedelta(seconds=v)
+    return d
+
+def cacheBlockCols(data):
+    # row block (after its header) -> [(type, data, NA), ...] of the columns, only decoded by cacheColVals
+    cols = []
+    pos = 0
+    view = memoryview(data)
+    while pos < len(data):
+        t, size, na_size = CACHE_COL_HEAD.unpack_from(data, pos)
+        pos += CACHE_COL_HEAD.size
+        cols.append((t.decode('ascii'), view[pos:pos+size], view[pos+size:pos+size+na_size]))
+        pos += size + na_size
+    return cols
+
+def cacheColVals(col):
+    t, data, na = col
+    if t == 'o':
+        return lazyImport('json').loads(bytes(data), object_hook=cacheJSONValue)
+    if t not in ('q', 'd'):
+        raise ValueError(f'cache column type {t}')
+    vals = array(t)
+    vals.frombytes(data)
+    if sys.byteorder != 'little':
+        vals.byteswap()
+    vals = vals.tolist()
+    if na:
+        for i in range(len(na)):
+            if na[i]:
+                vals[i] = CACHE_NA[na[i]-1]
+    return vals
+
+def fileHash(p):
+    h = hashlib.blake2b(digest_size=20)
+    with open(p, 'rb') as f:
+        for b in iter(lambda: f.read(1024*1024), b''):
+            h.update(b)
+    return h.hexdigest()
+
+def cacheMeta(cache_p):
+    try:
+        with open(cache_p, 'rb') as f:
+            f.seek(int.from_bytes(f.read(8), 'little'))
+            meta = lazyImport('json').loads(f.read().decode('utf-8'), object_hook=cacheJSONValue)
+        if isinstance(meta, dict) and meta.get('ver') == CACHE_VER:
+            return meta
+    except (OSError, ValueError):
+        pass
+    return None
+
+def cacheWriteMeta(f, meta):
+    f.write(lazyImport('json').dumps(meta, default=cacheJSON).encode('utf-8'))
+
+def buildCache(p, cache_p, src_hash):
+    print(f'building cache {cache_p}...')
+    st = os.stat(p)
+    src = XlsxSht(p) if os.path.splitext(p)[1].lower() in XLSX_EXT else XlxSht(p)
+    tmp = cache_p + '.tmp'
+    max_row = 1
+    try:
+        with open(tmp, 'wb') as f:
+            f.write(bytes(8))
+            for chunk in rowChunks(src.rows(), CACHE_BLOCK_ROW):
+                cols = list(zip(*chunk))
+                data = b''.join(CACHE_COL_HEAD.pack(t.encode('ascii'), len(d), len(na)) + d + na
+                                for t, d, na in map(cacheCol, cols[1:]))
+                f.write(CACHE_BLOCK_HEAD.pack(chunk[0][0], len(chunk), len(data)))
+                f.write(data)
+                max_row = chunk[-1][0]
+            meta_pos = f.tell()
+            meta = {'ver': CACHE_VER, 'size': st.st_size, 'mtime': st.st_mtime_ns, 'hash': src_hash,
+                    'title': src.title, 'max_column': src.max_column, 'max_row': max_row}
+            cacheWriteMeta(f, meta)
+            f.seek(0)
+            f.write(meta_pos.to_bytes(8, 'little'))
+    finally:
+        src.close()
+    os.replace(tmp, cache_p)
+    return meta
+
+def openCache(p):
+    """
+    <p>.x2n is used when the source has not changed: the same size/mtime, or
+    the same content hash, otherwise it's (re)built from the source first
+    """
+    cache_p = p + CACHE_EXT
+    meta = cacheMeta(cache_p)
+    st = os.stat(p)
+    if meta and (meta['size'], meta['mtime']) == (st.st_size, st.st_mtime_ns):
+        return CacheSht(cache_p, meta)
+    src_hash = fileHash(p)
+    if meta and meta['hash'] == src_hash:
+        # only touched, keep the new size/mtime so the next time won't hash again
+        meta['size'], meta['mtime'] = st.st_size, st.st_mtime_ns
+        try:
+            with open(cache_p, 'r+b') as f:
+                f.seek(int.from_bytes(f.read(8), 'little'))
+                cacheWriteMeta(f, meta)
+                f.truncate()
+        except OSError:
+            pass
+        return CacheSht(cache_p, meta)
+    try:
+        meta = buildCache(p, cache_p, src_hash)
+    except OSError as e:
+        print(f'cache error: {e}, use {p} directly')
+        return None
+    return CacheSht(cache_p, meta)
+
+def openSht(p, cache=False):
+    if cache:
+        sht = openCache(p)
+        if sht:
+            return sht
+    if os.path.splitext(p)[1].lower() in XLSX_EXT:
+        return XlsxSht(p)
+    return XlxSht(p)
+
+class RowCursor:
+    """
+    forward only cursor on a row stream, cur is None after the last row
+    passed: the row number of the last row passed
+    """
+    def __init__(self, rows, passed=0):
+        self.it = rows
+        self.passed = passed
+        self.cur = next(self.it, None)
+
+    def next(self):
+        if self.cur:
+            self.passed = self.cur[0]
+        self.cur = next(self.it, None)
+        return self.cur
+
+    def nextRow(self):
+        # row number of the current row (the one after the last when it's over)
+        return self.cur[0] if self.cur else self.passed + 1
+
+class ColChunk:
+    """
+    columnar view of a row chunk, only the referenced columns are loaded
 
-def xlsx2sht(p_dr, p_gnss):
+    col_type: {column: 'd' (float64) | 'q' (int) | '' (keep the cell value)}
+    col[column] is the column values, na[column] flags the NA cells
+    (the value is 0 in the float64/int columns)
+    """
+    def __init__(self, rows, col_type):
+        self.len = len(rows)
+        self.row = array('q', [r[0] for r in rows])
+        self.col = {}
+        self.na = {}
+        for c, t in col_type.items():
+            vals = [r[c] for r in rows]
+            na = bytearray(isNA(v) for v in vals)
+            if t:
+                vals = colArray(t, vals, na)
+            self.col[c] = vals
+            self.na[c] = na
+
+def colArray(t, vals, na):
+    try:
+        return array(t, [0 if n else v for v, n in zip(vals, na)])
+    except (TypeError, ValueError, OverflowError):
+        pass
+    # float in an int column, number as text, etc.
+    cast = float if t == 'd' else int
+    col = array(t)
+    for i in range(len(vals)):
+        v = 0
+        if not na[i]:
+            try:
+                v = cast(vals[i])
+            except (TypeError, ValueError, OverflowError):
+                na[i] = 1
+                v = 0
+        col.append(v)
+    return col
+
+def rowChunks(rows, n):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == n:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def xlsx2sht(p_dr, p_gnss, cache=False):
     try:
         if p_dr != '':
             print(f'loading {p_dr}...')
-            wb_dr = openpyxl.load_workbook(p_dr)
-            sht_dr= wb_dr[wb_dr.sheetnames[0]]
+            sht_dr = openSht(p_dr, cache)
             print(f'done')
         else:
             sht_dr = 0
@@ -129,8 +792,7 @@ def xlsx2sht(p_dr, p_gnss):
                 print('skip the second file')
             else:
                 print(f'loading {p_gnss}...')
-                wb_gnss = openpyxl.load_workbook(p_gnss)
-                sht_gnss= wb_gnss[wb_gnss.sheetnames[0]]
+                sht_gnss = openSht(p_gnss, cache)
                 print(f'done')
         else:
             sht_gnss = 0
@@ -140,12 +802,34 @@ def xlsx2sht(p_dr, p_gnss):
         print(f'open file error: {e}')
         return (0, 0)
 
+def xlsxClose(sht_dr, sht_gnss):
+    if sht_dr:
+        sht_dr.close()
+    if sht_gnss and sht_gnss is not sht_dr:
+        sht_gnss.close()
+
+def getTitleIndex(title, max_column):
+    # title name -> column list (ascending), row 1 is only walked once per sheet
+    index = {}
+    for col in range(1, max_column+1):
+        if title[col] is not None:
+            index.setdefault(title[col], []).append(col)
+    return index
+
 def getIndexFrmName(xlsx_sht,xlsx_name,start_col):
-    col = xlsx_sht.max_column
-    for col in range(start_col, xlsx_sht.max_column+1):
-        if xlsx_sht.cell(row=1, column=col).value == xlsx_name:
-            break
-    return col, xlsx_sht.max_column
+    # not found: return (max_column+1, max_column+1), so the last column can be found as well
+    col_max = xlsx_sht.max_column+1
+    for col in xlsx_sht.index.get(xlsx_name, ()):
+        if col >= start_col:
+            return col, col_max
+    return col_max, col_max
+
+def getCNOFrmName(title_name, sv_str):
+    # 'SVnn CNO (name)' -> CNO_NAME_List index, len(CNO_NAME_List) when it's not a CNO title
+    sv_tag = 'SV' + sv_str + ' CNO ('
+    if isinstance(title_name, str) and title_name.startswith(sv_tag) and title_name[-1] == ')':
+        return CNO_NAME_Index.get(title_name[len(sv_tag):-1], len(CNO_NAME_List))
+    return len(CNO_NAME_List)
 
 def isNA (a):
     if a == '=NA()' or a == '#N/A' or a == None:
@@ -153,40 +837,72 @@ def isNA (a):
     else:
         return False
 
-def getUTCtag(gpsWeeks, gpsTimeofWeek):
-    if isNA(gpsWeeks) or isNA(gpsTimeofWeek):
-        return ''
-
-    if gpsTimeofWeek >= SEC_WEEK:
-        gpsTimeofWeek -= SEC_WEEK
-        gpsWeeks += 1
-
-    while gpsWeeks < BASE_WEEK:
-        gpsWeeks += GPS_MODE
-    
-    return Time(gpsWeeks*SEC_WEEK+gpsTimeofWeek,format='gps',scale='utc').iso
-
-def getPos(isLat, Pos):
-    if isNA(Pos):
-        P = ''
-        P_dir = ''
-    else:
-        if Pos > 0:
-            if isLat:
-                P_dir = 'N'
-            else:
-                P_dir = 'E'
-        else:
-            Pos = abs(Pos)
-            if isLat:
-                P_dir = 'S'
-            else:
-                P_dir = 'W'
+def getUTCtagList(gpsWeeksList, gpsTimeofWeekList, weekNAList, towNAList):
+    """
+    GPS week/time of week columns and their NA flags -> [(hhmmss.sss, ddmmyy), ...]
+    ('', '') for the NA rows
+    """
+    utcList = []
+    day_dict = {}
+    # the leap second only changes every few years, only look it up
+    # again when the time goes out of the current [leap_start, leap_end)
+    leap_start = leap_end = 0
+    leap = 0
+    for gpsWeeks, gpsTimeofWeek, week_na, tow_na in zip(gpsWeeksList, gpsTimeofWeekList, weekNAList, towNAList):
+        if week_na or tow_na:
+            utcList.append(('', ''))
+            continue
 
-        P = str(int(Pos)*100+round((Pos - int(Pos))*60,8))
-    return P,P_dir
+        if gpsTimeofWeek >= SEC_WEEK:
+            gpsTimeofWeek -= SEC_WEEK
+            gpsWeeks += 1
+
+        while gpsWeeks < BASE_WEEK:
+            gpsWeeks += GPS_MODE
+
+        # in milliseconds, the same resolution as the NMEA time
+        gps_ms = int(gpsWeeks)*SEC_WEEK*1000 + round(gpsTimeofWeek*1000)
+        gps_sec = gps_ms//1000
+        if gps_sec < leap_start or gps_sec >= leap_end:
+            i = bisect_right(GPS_LEAP_SEC, gps_sec)
+            leap = GPS_LEAP_List[i-1][1] if i else 0
+            leap_start = GPS_LEAP_SEC[i-1] if i else 0
+            leap_end = GPS_LEAP_SEC[i] if i < len(GPS_LEAP_SEC) else gps_sec+SEC_WEEK*GPS_MODE
+        day, ms = divmod(gps_ms - leap*1000, SEC_DAY*1000)
+
+        ddmmyy = day_dict.get(day)
+        if ddmmyy is None:
+            ddmmyy = (GPS_BDATE + timedelta(days=day)).strftime('%d%m%y')
+            day_dict[day] = ddmmyy
+
+        sec, ms = divmod(ms, 1000)
+        hour, sec = divmod(sec, 3600)
+        minute, sec = divmod(sec, 60)
+        utcList.append((f'{hour:02}{minute:02}{sec:02}.{ms:03}', ddmmyy))
+    return utcList
+
+def getPosList(isLat, posList, naList):
+    """
+    latitude/longitude column (deg) -> [(ddmm.mmmmmmmm or dddmm.mmmmmmmm, N/S or E/W), ...]
+    ('', '') for the NA rows
+    """
+    posStrList = []
+    scale = 10**NMEA_POS_DEC
+    deg_scale = 60*scale
+    # the minutes in integer units of the last decimal, no float str() (and its 59.99999999 minutes)
+    fmt = ('%02d' if isLat else '%03d') + '%02d.%0' + str(NMEA_POS_DEC) + 'd'
+    pos_dir = ('N', 'S') if isLat else ('E', 'W')
+    for pos, na in zip(posList, naList):
+        # NaN/inf as NA as well
+        if na or not -360.0 <= pos <= 360.0:
+            posStrList.append(('', ''))
+            continue
+        deg, minute = divmod(round(abs(pos)*deg_scale), deg_scale)
+        posStrList.append((fmt % (deg, *divmod(minute, scale)), pos_dir[pos <= 0]))
+    return posStrList
 
-def getSVLsFrmGNSS(svStart,svEnd,sht_gnss):
+def getSVLsFrmGNSS(svStart,svEnd,sht_gnss,gsv_type):
+    # -> SVLayout, None when no SV is found
     sv_list = []
     next_col = 1
     cno_name_max = len(CNO_NAME_List)
@@ -207,172 +923,588 @@ def getSVLsFrmGNSS(svStart,svEnd,sht_gnss):
 
             sv_tag = 'SV' + j + ' CNO'
             # very old format do not have L1,L2,L5,G1,G2,etc.
-            if sht_gnss.cell(row=1, column=sv_used_col+m).value != sv_tag:
-                for n in range(cno_name_max):
-                    # check the first CNO: L1,G1,etc.
-                    sv_tag = 'SV' + j + ' CNO' + ' (' + CNO_NAME_List[n] + ')'
-                    if sht_gnss.cell(row=1, column=sv_used_col+m).value == sv_tag:
-                        cno1 = n
-                        m = 2
-                        break
+            if sht_gnss.title[sv_used_col+m] != sv_tag:
+                # check the first CNO: L1,G1,etc.
+                cno1 = getCNOFrmName(sht_gnss.title[sv_used_col+m], j)
                 if cno1 == cno_name_max:
-                    return []
+                    return None
+                m = 2
                 
                 # check the second CNO: L2/L5,G2,etc.
-                for n in range(cno_name_max):
-                    sv_tag = 'SV' + j + ' CNO' + ' (' + CNO_NAME_List[n] + ')'
-                    if sht_gnss.cell(row=1, column=sv_used_col+m).value == sv_tag:
-                        cno2 = n
-                        break
+                cno2 = getCNOFrmName(sht_gnss.title[sv_used_col+m], j)
                 if cno2 == cno_name_max:
                         # some time it only has L1,G1,etc, do not have L2/L5,G2
                         m = 1
 
             sv_tag = 'SV' + j + ' Azim (deg)'
-            if sht_gnss.cell(row=1, column=sv_used_col+m+1).value != sv_tag:
+            if sht_gnss.title[sv_used_col+m+1] != sv_tag:
                 print(f'{sv_tag} missing, {sv_used_col}, {cno1}, {cno2}, {m}')
-                return []
+                return None
             
             sv_tag = 'SV' + j + ' Elev (deg)'
-            if sht_gnss.cell(row=1, column=sv_used_col+m+2).value != sv_tag:
+            if sht_gnss.title[sv_used_col+m+2] != sv_tag:
                 print(f'{sv_tag} missing')
-                return []
+                return None
 
-            sv_list.append(i)           #sv number
-            sv_list.append(sv_used_col) #sv used col location
-            sv_list.append(cno1)        #cno1 name index
-            sv_list.append(cno2)        #cno2 name index
+            # sv number, used, elev, azim, cno1, cno1 name, cno2, cno2 name
+            sv_list.append((i, sv_used_col, sv_used_col+m+2, sv_used_col+m+1,
+                            sv_used_col+1, '' if cno1 == cno_name_max else CNO_NAME_List[cno1],
+                            sv_used_col+2 if m == 2 else 0, CNO_NAME_List[cno2] if m == 2 else ''))
             
             next_col = sv_used_col+m+3
     
-    return sv_list
-
-def getGGAItemFrmGNSS(index, time_tag, time_gnss_index, GGA_6, GGA_7, GGA_8, GGA_13, sht_gnss):
-    if time_tag == sht_gnss.cell(index, time_gnss_index).value:
-        match = 1
-        fix_type = sht_gnss.cell(index, GGA_6).value
-        if isNA(fix_type):
-            fix_type = ''
-        else:
-            fix_type = str(fix_type)
-                    
-        sv_used = sht_gnss.cell(index, GGA_7).value
-        if isNA(sv_used):
-            sv_used = ''
-        else:
-            sv_used = str(sv_used).zfill(2)
-                    
-        hdop = sht_gnss.cell(index, GGA_8).value
-        if isNA(hdop):
-            hdop = ''
-        else:
-            hdop = str(round(hdop,2))
+    if sv_list == []:
+        return None
+    return SVLayout(gsv_type=gsv_type, sv=tuple(sv_list))
 
-        age_corr = sht_gnss.cell(index, GGA_13).value
-        if isNA(age_corr):
-            age_corr = ''
-        else:
-            age_corr = str(age_corr)
-    else:
-        match = 0
+def gpsTimeDiff(week1, tow1, week2, tow2):
+    # time 1 - time 2 (sec), the week is only used when both rows have it
+    if isNA(week1) or isNA(week2):
+        return tow1 - tow2
+    return (week1 - week2)*SEC_WEEK + (tow1 - tow2)
+
+class TimeAlign:
+    """
+    merge join of the DR rows and the GNSS rows on the GPS time
+
+    both xlx are in time order, so the GNSS rows are walked only once,
+    in step with the DR rows, and the GNSS rows are dropped once passed
+    the week is part of the time, so the time of week reset at the end of
+    a week is not taken as going back in time
+    """
+    def __init__(self, gnss_rows, gga, tol=None, gnss_row=2, hold=False):
+        # gnss_row: the row number gnss_rows starts from
+        # hold: stop at the DR row when the GNSS rows are over, the GNSS
+        # row of it may come later in a growing log (see align)
+        self.cur = RowCursor(gnss_rows, gnss_row-1)
+        self.gga = gga
+        self.tol = ALIGN_TOL if tol is None else tol
+        self.hold = hold
+        # match: DR rows with GNSS, mismatch: DR rows without GNSS
+        # gnss_skip: GNSS rows without DR, time_na: DR rows without time
+        # scan/scan_max: GNSS rows passed to find the DR time (all, the most for a DR row)
+        self.stat = {'match': 0, 'mismatch': 0, 'gnss_skip': 0, 'time_na': 0, 'scan': 0, 'scan_max': 0}
+
+    def align(self, dr_chunk):
+        # -> matched GNSS rows, and the index in it for each DR row (-1: no match)
+        # gnss_j is shorter than dr_chunk when a DR row is held
+        gnss_chunk = []
+        gnss_j = []
+        for dr_vals in dr_chunk:
+            gnss_vals = self.match(dr_vals)
+            if gnss_vals is ALIGN_HOLD:
+                break
+            if gnss_vals:
+                gnss_j.append(len(gnss_chunk))
+                gnss_chunk.append(gnss_vals)
+            else:
+                gnss_j.append(-1)
+        return gnss_chunk, gnss_j
+
+    def match(self, dr_vals):
+        gga = self.gga
+        dr_week = dr_vals[gga.week]
+        time_tag = dr_vals[gga.tow]
+        if isNA(time_tag):
+            self.stat['time_na'] += 1
+            return None
+
+        scan = 0
+        while self.cur.cur:
+            gnss_vals = self.cur.cur
+            gnss_time_of_week = gnss_vals[gga.gnss_tow]
+            if isNA(gnss_time_of_week):
+                self.cur.next()
+                self.stat['gnss_skip'] += 1
+                continue
+
+            dt = gpsTimeDiff(dr_week, time_tag, gnss_vals[gga.gnss_week], gnss_time_of_week)
+            if abs(dt) <= self.tol:
+                if DBG_PRT and scan:
+                    print(f'Match: DR-{dr_vals[0]} GNSS-{gnss_vals[0]}')
+                self.cur.next()
+                self.stat['match'] += 1
+                self.addScan(scan)
+                return gnss_vals
+
+            if DBG_PRT and not scan:
+                print(f'Mismatch: DR-{dr_vals[0]}:{time_tag} GNSS-{gnss_vals[0]}:{gnss_time_of_week}')
+            if dt < 0:
+                # DR xlx time tag is smaller than GNSS time tag, it means
+                # GNSS has some missing period, just skip it
+                break
+            # GNSS row before the DR time tag will never match the following DR rows
+            self.cur.next()
+            self.stat['gnss_skip'] += 1
+            scan += 1
+
+        self.addScan(scan)
+        if self.hold and self.cur.cur is None:
+            return ALIGN_HOLD
+        self.stat['mismatch'] += 1
+        return None
+
+    def addScan(self, scan):
+        if scan:
+            self.stat['scan'] += scan
+            if scan > self.stat['scan_max']:
+                self.stat['scan_max'] = scan
+
+def getGGAItemFrmGNSS(gn, j, gga):
+    if j < 0:
+        return '','','',''
+
+    if gn.na[gga.fix][j]:
         fix_type = ''
+    else:
+        fix_type = str(gn.col[gga.fix][j])
+                
+    if gn.na[gga.sv_used][j]:
         sv_used = ''
+    else:
+        sv_used = str(gn.col[gga.sv_used][j]).zfill(2)
+                
+    if gn.na[gga.hdop][j]:
         hdop = ''
-        age_corr = ''
-
-    return match,fix_type,sv_used,hdop,age_corr
+    else:
+        hdop = str(round(gn.col[gga.hdop][j],2))
 
-def svInfoLstGSV(gsv_title_list,sht_row,sht_gnss):
-    l = len(gsv_title_list)
-    if not l:
-        return []
+    if gn.na[gga.age][j]:
+        age_corr = ''
+    else:
+        age_corr = str(gn.col[gga.age][j])
 
-    gsv_used_list = []
-    cno_name_index_max = len(CNO_NAME_List)
+    return fix_type,sv_used,hdop,age_corr
 
+def svInfoLstGSV(svl,gn,j):
     """
     XLX has 3 type:
     1. SVused |             CNO           | Azim | Elev
     2. SVused |         CNO (name1)       | Azim | Elev
     3. SVused | CNO (name1) | CNO (name2) | Azim | Elev
+    the columns of each SV are found once (SVLayout), whatever the type
 
     GSV format (my version):
     SV number, Elev, Azim, SNR1, name1, SNR2, name2
     """
-    for i in range(0,l,GSV_LIST_SUBELEM_NUM):
-        isUsed = sht_gnss.cell(sht_row, gsv_title_list[i+1]).value
-        if not isNA(isUsed) and isUsed:
-            gsv_used_list.append(gsv_title_list[i]) # SV number
-            
-            if gsv_title_list[i+3] == cno_name_index_max:
-                gsv_used_list.append(sht_gnss.cell(sht_row, gsv_title_list[i+1]+3).value) # Elev
-                
-                gsv_used_list.append(sht_gnss.cell(sht_row, gsv_title_list[i+1]+2).value) # Azim
-                
-                # SNR1
-                tmp = sht_gnss.cell(sht_row, gsv_title_list[i+1]+1).value
-                gsv_used_list.append('' if isNA(tmp) else tmp)
-               
-                # SNR1 name
-                if gsv_title_list[i+2] == cno_name_index_max:
-                    gsv_used_list.append('')
-                else:
-                    gsv_used_list.append(CNO_NAME_List[gsv_title_list[i+2]])
-                
-                gsv_used_list.append('') # SNR2
-                gsv_used_list.append('') # SNR2 name
-            else:
-                gsv_used_list.append(sht_gnss.cell(sht_row, gsv_title_list[i+1]+4).value) # Elev
-                
-                gsv_used_list.append(sht_gnss.cell(sht_row, gsv_title_list[i+1]+3).value) # Azim
-                
-                # SNR1
-                tmp = sht_gnss.cell(sht_row, gsv_title_list[i+1]+1).value
-                gsv_used_list.append('' if isNA(tmp) else tmp)
-                
-                # SNR1 name
-                if gsv_title_list[i+2] == cno_name_index_max:
-                    gsv_used_list.append('')
-                else:
-                    gsv_used_list.append(CNO_NAME_List[gsv_title_list[i+2]]) 
-                
-                # SNR2
-                tmp = sht_gnss.cell(sht_row, gsv_title_list[i+1]+2).value
-                gsv_used_list.append('' if isNA(tmp) else tmp) 
-                
-                # SNR2 name
-                gsv_used_list.append(CNO_NAME_List[gsv_title_list[i+3]]) 
-
-
+    col = gn.col
+    na = gn.na
+    gsv_used_list = []
+    for sv, used, elev, azim, cno1, name1, cno2, name2 in svl.sv:
+        if not na[used][j] and col[used][j]:
+            gsv_used_list += (sv, '' if na[elev][j] else col[elev][j], '' if na[azim][j] else col[azim][j],
+                              '' if na[cno1][j] else col[cno1][j], name1,
+                              '' if not cno2 or na[cno2][j] else col[cno2][j], name2)
     return gsv_used_list
 
 def msgLstGSV(gsv_type, svInfoLst, msg_num, msg_index, elem_num, index_start, sv_total):
-    gsv_list_tail = ''
-    for i in range(elem_num*GSV_SUBELEM_NUM):
-        if i == (elem_num*GSV_SUBELEM_NUM - 1):
-            gsv_list_tail += str(svInfoLst[index_start+i])
-        else:
-            gsv_list_tail += str(svInfoLst[index_start+i]) + ','
+    gsv_list_tail = ','.join([str(i) for i in svInfoLst[index_start:index_start+elem_num*GSV_SUBELEM_NUM]])
 
     return GenNMEAMsg(DBG_PRT,'',gsv_type + 'GSV', str(msg_num), str(msg_index), str(sv_total), gsv_list_tail)
 
+class NmeaWriter:
+    """
+    buffered NMEA output file
+
+    the sentences (bytes, see GenNMEAMsg) are kept in the buffer, then written in
+    big blocks (buf_size bytes), directly compressed when compress is 'gz'/'xz'
+    """
+    def __init__(self, fl_name, compress='', buf_size=WR_BUF_SIZE, mode='wb'):
+        # mode 'ab': add to the file (a new gz/xz stream for the compressed file)
+        self.f = NMEA_COMPRESS_List[compress](fl_name, mode)
+        self.buf = []
+        self.size = 0
+        self.buf_size = buf_size
+        # bytes/lines written so far
+        self.total = 0
+        self.lines = 0
+
+    def write(self, msg_list):
+        if msg_list:
+            self.writeBlock(NmeaBlock(msg_list))
+
+    def writeBlock(self, block):
+        if block:
+            self.buf.append(block)
+            self.size += len(block)
+            self.total += len(block)
+            self.lines += block.count(NMEA_EOL)
+            if self.size >= self.buf_size:
+                self.flush()
+
+    def flush(self):
+        if self.buf:
+            self.f.write(b''.join(self.buf))
+            self.buf = []
+            self.size = 0
+
+    def close(self):
+        self.flush()
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def NmeaBlock(msg_list):
+    # sentences -> lines in bytes
+    return NMEA_EOL.join(msg_list) + NMEA_EOL if msg_list else b''
+
+def gpsSec(week, tow):
+    # GPS time in sec of a row, None when it has no time
+    try:
+        return None if isNA(week) or isNA(tow) else int(week)*SEC_WEEK + float(tow)
+    except (TypeError, ValueError):
+        return None
+
+def shardBlock(msg_list, epochs, dr_chunk, gga):
+    """
+    lines of a chunk for ShardWriter -> (NmeaBlock, [end of each DR row in it], [GPS sec of each DR row])
+    epochs: see chunk2nmea
+    """
+    ends = array('q')
+    pos = start = 0
+    eol = len(NMEA_EOL)
+    for end in epochs:
+        pos += sum(map(len, msg_list[start:end])) + eol*(end - start)
+        ends.append(pos)
+        start = end
+    times = [gpsSec(vals[gga.week], vals[gga.tow]) for vals in dr_chunk]
+    return NmeaBlock(msg_list), ends, times
+
+def threadIter(it, maxsize=PIPE_QUEUE):
+    """
+    items of it, read ahead in a thread (maxsize items at most), for the reading
+    to go on while the items are converted; close() the generator to stop the thread
+    """
+    queue = lazyImport('queue')
+    q = queue.Queue(maxsize)
+    stop = lazyImport('threading').Event()
+    end = object()
+
+    def read():
+        try:
+            for item in it:
+                item = (item, None)
+                # wait for the room, but not after the stop
+                while not stop.is_set():
+                    try:
+                        q.put(item, timeout=0.1)
+                        break
+                    except queue.Full:
+                        pass
+                if stop.is_set():
+                    return
+            q.put((end, None))
+        except BaseException as e:
+            q.put((end, e))
+
+    thread = lazyImport('threading').Thread(target=read, name='xlx2nmea-reader', daemon=True)
+    thread.start()
+    try:
+        while 1:
+            item, err = q.get()
+            if item is end:
+                if err:
+                    raise err
+                return
+            yield item
+    finally:
+        stop.set()
+        # the reader may wait for the room
+        while thread.is_alive():
+            try:
+                q.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+class PipeWriter:
+    """
+    NmeaWriter/ShardWriter in a thread: the blocks (or sentence lists) are queued,
+    maxsize of them at most, and written while the next chunks are converted
+    the counters (lines, total, ...) are the writer's, after flush()
+    """
+    def __init__(self, writer, maxsize=PIPE_WR_QUEUE):
+        self.writer = writer
+        self.q = lazyImport('queue').Queue(maxsize)
+        self.err = None
+        self.thread = lazyImport('threading').Thread(target=self.run, name='xlx2nmea-writer', daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while 1:
+            item = self.q.get()
+            try:
+                if item is None:
+                    return
+                if self.err is None:
+                    op, data = item
+                    if op == 'block':
+                        self.writer.writeBlock(data)
+                    elif op == 'msg':
+                        self.writer.write(data)
+                    else:
+                        self.writer.flush()
+            except BaseException as e:
+                self.err = e
+            finally:
+                self.q.task_done()
+
+    def check(self):
+        if self.err is not None:
+            err, self.err = self.err, None
+            raise err
+
+    def writeBlock(self, block):
+        self.check()
+        self.q.put(('block', block))
+
+    def write(self, msg_list):
+        self.check()
+        if msg_list:
+            self.q.put(('msg', msg_list))
+
+    def flush(self):
+        # all the queued blocks written
+        self.q.put(('flush', None))
+        self.q.join()
+        self.check()
+
+    def close(self):
+        self.q.put(None)
+        self.thread.join()
+        self.writer.close()
+        self.check()
+
+    def __getattr__(self, name):
+        return getattr(self.writer, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class NmeaShard:
+    """
+    one file of ShardWriter, the parts are written in the writer threads one after another
+    """
+    def __init__(self, fl_name, compress):
+        self.fl_name = fl_name
+        self.compress = compress
+        self.f = None
+        # the part being written
+        self.fut = None
+        self.buf = []
+        self.size = 0
+        # GPS time of the first/last row, the key of the time span
+        self.start = self.end = None
+        self.key = None
+        self.rows = 0
+        self.lines = 0
+        self.total = 0
+
+    def write(self, data, close=False):
+        # in the writer thread
+        if self.f is None:
+            self.f = NmeaWriter(self.fl_name, self.compress)
+        self.f.writeBlock(data)
+        self.f.flush()
+        if close:
+            self.f.close()
+
+    def info(self):
+        # manifest entry
+        def weekTow(t):
+            if t is None:
+                return None
+            week = int(t//SEC_WEEK)
+            return [week, round(t - week*SEC_WEEK, 3)]
+        return {'file': os.path.basename(self.fl_name), 'start': weekTow(self.start),
+                'end': weekTow(self.end), 'rows': self.rows, 'lines': self.lines, 'bytes': self.total}
+
+class ShardWriter:
+    """
+    NMEA output split into files (<name>-0001.txt, ...) by the GPS time span and/or the size,
+    always at a DR row, and a manifest with the GPS time range of each file (<name>.manifest.json)
+
+    span: sec of GPS time per file (from the GPS time 0, 3600: one file per GPS hour), 0: no time split
+    size: bytes (uncompressed) per file at most, 0: no size split
+    the files are written and compressed in SHARD_WRITERS threads, the conversion goes on meanwhile
+    """
+    def __init__(self, fl_name, compress='', span=0, size=0, buf_size=WR_BUF_SIZE, writers=SHARD_WRITERS):
+        if compress and fl_name.endswith('.' + compress):
+            fl_name = fl_name[:-len(compress)-1]
+        self.root, self.ext = os.path.splitext(fl_name)
+        self.compress = compress
+        self.span = span
+        self.size = size
+        self.buf_size = buf_size
+        self.manifest = self.root + SHARD_MANIFEST
+        self.shards = []
+        self.cur = None
+        self.pool = lazyImport('concurrent.futures').ThreadPoolExecutor(writers)
+        # bytes/lines written so far
+        self.total = 0
+        self.lines = 0
+
+    def writeBlock(self, block):
+        # block: see shardBlock
+        data, ends, times = block
+        cut = prev = 0
+        for end, t in zip(ends, times):
+            if self.newShard(t, end - prev):
+                self.addData(data[cut:prev])
+                cut = prev
+                self.openShard()
+            cur = self.cur
+            cur.rows += 1
+            cur.total += end - prev
+            if t is not None:
+                if cur.start is None:
+                    cur.start = t
+                    cur.key = int(t//self.span) if self.span else None
+                cur.end = t
+            prev = end
+        self.addData(data[cut:prev])
+
+    def newShard(self, t, n):
+        # the DR row of t, n bytes goes to a new file
+        cur = self.cur
+        if cur is None:
+            return True
+        if self.span and t is not None and cur.key is not None and int(t//self.span) != cur.key:
+            return True
+        return bool(self.size and cur.total and cur.total + n > self.size)
+
+    def openShard(self):
+        if self.cur:
+            self.submit(self.cur, True)
+        fl_name = f'{self.root}-{len(self.shards)+1:04}{self.ext}'
+        if self.compress:
+            fl_name += '.' + self.compress
+        self.cur = NmeaShard(fl_name, self.compress)
+        self.shards.append(self.cur)
+
+    def addData(self, data):
+        if not data:
+            return
+        cur = self.cur
+        cur.buf.append(data)
+        cur.size += len(data)
+        lines = data.count(NMEA_EOL)
+        cur.lines += lines
+        self.lines += lines
+        self.total += len(data)
+        if cur.size >= self.buf_size:
+            self.submit(cur)
+
+    def submit(self, shard, close=False):
+        # only one part of a file at a time, in the order
+        data = b''.join(shard.buf)
+        shard.buf = []
+        shard.size = 0
+        if shard.fut:
+            shard.fut.result()
+        shard.fut = self.pool.submit(shard.write, data, close)
+
+    def flush(self):
+        if self.cur and self.cur.buf:
+            self.submit(self.cur)
+
+    def close(self):
+        try:
+            if self.cur:
+                self.submit(self.cur, True)
+            for shard in self.shards:
+                shard.fut.result()
+        finally:
+            self.pool.shutdown()
+        self.writeManifest()
+
+    def writeManifest(self):
+        manifest = {'ver': SHARD_VER, 'xver': xver, 'span': self.span, 'size': self.size,
+                    'compress': self.compress, 'shards': [shard.info() for shard in self.shards]}
+        tmp = self.manifest + '.tmp'
+        with open(tmp, 'wt') as f:
+            lazyImport('json').dump(manifest, f, indent=1)
+        os.replace(tmp, self.manifest)
+
+    def files(self):
+        return [shard.fl_name for shard in self.shards]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
 def msgLstWrNMEA(msg_list,nmea_log):
-    if msg_list:
-        for msg in msg_list:
-            nmea_log.write(str(msg)+'\n')
+    nmea_log.write(msg_list)
+
+class ConvProfile:
+    """
+    wall-clock seconds of each conversion stage (PROF_STAGE_List) and the counters
 
-def msgGSA(gsa_title_list, gsv_title_list, sht_row, sht_gnss):
-    if gsa_title_list == []:
+    load: open the xlx and read the DR rows, index: title columns
+    align: DR/GNSS time match (with the GNSS rows reading), columns: see ColChunk
+    utc: GPS time to UTC, GGA/RMC/GSV/GSA: the sentences, write: NmeaWriter
+    the chunk stages are timed in the worker processes when jobs > 1,
+    then they add up to more than the conversion time
+    """
+    def __init__(self):
+        self.t = dict.fromkeys(PROF_STAGE_List, 0.0)
+        self.count = {'rows': 0, 'chunks': 0, 'sentences': 0, 'bytes': 0}
+        self.t_start = time.perf_counter()
+        self.t_prt = 0.0
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.t[name] += time.perf_counter() - t
+
+    def add(self, t):
+        for name, sec in t.items():
+            self.t[name] += sec
+
+    def progress(self, row, max_row):
+        # a line every PROGRESS_SEC at most
+        now = time.perf_counter()
+        if now - self.t_prt < PROGRESS_SEC:
+            return
+        self.t_prt = now
+        if max_row:
+            print(f'process: {round(((row+1)/max_row)*100,1)}%', end= '\r')
+        else:
+            print(f'process: {row-1} lines', end= '\r')
+
+    def result(self, stat):
+        return {'total': time.perf_counter() - self.t_start,
+                'stage': dict(self.t), 'count': dict(self.count, **stat)}
+
+    def report(self, stat):
+        res = self.result(stat)
+        print(f"time: {round(res['total'],3)} s, " +
+              ', '.join(f'{name} {round(sec,3)}' for name, sec in res['stage'].items()))
+
+    def dump(self, p, stat):
+        with open(p, 'wt') as f:
+            lazyImport('json').dump(self.result(stat), f, indent=1)
+
+def msgGSA(gsa, svInfoLst, gn, j):
+    if gsa is None:
         return []
-    svInfoLst = svInfoLstGSV(gsv_title_list,sht_row,sht_gnss)
     if svInfoLst == []:
         return []
 
     msg = []
-    gsa2 = str(sht_gnss.cell(sht_row, gsa_title_list[0]).value)
-    gsa4 = str(sht_gnss.cell(sht_row, gsa_title_list[1]).value)
-    gsa5 = str(sht_gnss.cell(sht_row, gsa_title_list[2]).value)
-    gsa6 = str(sht_gnss.cell(sht_row, gsa_title_list[3]).value)
+    gsa2, gsa4, gsa5, gsa6 = ['' if gn.na[c][j] else str(gn.col[c][j])
+                              for c in (gsa.fix, gsa.pdop, gsa.hdop, gsa.vdop)]
     
     sv_total = int(len(svInfoLst)/GSV_SUBELEM_NUM)
     for i in range(sv_total):
@@ -380,8 +1512,7 @@ def msgGSA(gsa_title_list, gsv_title_list, sht_row, sht_gnss):
 
     return msg
 
-def msgGSV(gsv_type, gsv_title_list, sht_row, sht_gnss):
-    svInfoLst = svInfoLstGSV(gsv_title_list,sht_row,sht_gnss)
+def msgGSV(gsv_type, svInfoLst):
     if svInfoLst == []:
         return []
     
@@ -407,118 +1538,173 @@ def msgGSV(gsv_type, gsv_title_list, sht_row, sht_gnss):
 
     return msgList
 
+class SlotLayout:
+    """
+    column layout found from the titles, the fields are __slots__ (set by keyword)
+    """
+    __slots__ = ()
+
+    def __init__(self, **kw):
+        for name in self.__slots__:
+            setattr(self, name, kw.get(name, 0))
+
+    def __repr__(self):
+        return type(self).__name__ + '(' + ', '.join(f'{n}={getattr(self, n)!r}' for n in self.__slots__) + ')'
+
+    def data(self):
+        # {field: value}, SlotLayout(**data) makes it again
+        return {n: getattr(self, n) for n in self.__slots__}
+
+class GGALayout(SlotLayout):
+    """
+    GGA columns, and the DR/GNSS time columns of the alignment
+    week/tow/lat/lon/msl/wgs: DR (msl or wgs is 0 when not found)
+    gnss_week/gnss_tow/gnss_lat/fix/sv_used/hdop/age: GNSS
+    """
+    __slots__ = ('week', 'tow', 'lat', 'lon', 'msl', 'wgs',
+                 'gnss_week', 'gnss_tow', 'gnss_lat', 'fix', 'sv_used', 'hdop', 'age')
+
+class RMCLayout(SlotLayout):
+    # RMC columns (GNSS)
+    __slots__ = ('week', 'tow', 'lat', 'lon', 'speed', 'heading')
+
+class GSALayout(SlotLayout):
+    # GSA columns (GNSS)
+    __slots__ = ('fix', 'pdop', 'hdop', 'vdop')
+
+class SVLayout(SlotLayout):
+    """
+    SV columns of a constellation (see getSVLsFrmGNSS), gsv_type: 'GP', 'GL', etc.
+    sv: ((SV number, used, elev, azim, cno1, cno1 name, cno2, cno2 name), ...)
+    cno2 is 0 and its name '' when there is only one CNO,
+    the cno1 name is '' for the very old format ('SVnn CNO')
+    """
+    __slots__ = ('gsv_type', 'sv')
+
+class ConvLayout(SlotLayout):
+    """
+    columns of a conversion, see getLayout
+    gga: GGALayout, rmc: RMCLayout (None: no RMC), gsa: GSALayout (None: no GSA)
+    gsv: [SVLayout, ...] in the GSV order, [] for no GSV/GSA
+    dr_col/gnss_col: the columns loaded into ColChunk (see getColType)
+    gnss_ret: 1: DR+GNSS, 2: GNSS only (the DR rows come from the GNSS xlx)
+    """
+    __slots__ = ('gga', 'rmc', 'gsa', 'gsv', 'dr_col', 'gnss_col', 'gnss_ret')
+
 def getIndexNameGGA(sht_dr, sht_gnss):
-    ggaList = []
+    gga = GGALayout()
     print('checking GGA index name in XLSX...')
     RMC_9, GGA_MAX = getIndexFrmName(sht_dr,RMC_9_DR,1)
     if RMC_9 == GGA_MAX:
-        return []
-    ggaList.append(RMC_9) # 0
+        return None
+    gga.week = RMC_9
 
     GGA_1, GGA_MAX = getIndexFrmName(sht_dr,GGA_1_DR,1)
     if GGA_1 == GGA_MAX:
-        return []
-    ggaList.append(GGA_1) # 1
+        return None
+    gga.tow = GGA_1
     
     GGA_1_gnss, GGA_MAX = getIndexFrmName(sht_gnss,GGA_1_GNSS,1)
     if GGA_1_gnss == GGA_MAX:
-        return []
-    ggaList.append(GGA_1_gnss) # 2
+        return None
+    gga.gnss_tow = GGA_1_gnss
    
     GGA_2, GGA_MAX = getIndexFrmName(sht_dr,GGA_2_DR,1)
     if GGA_2 == GGA_MAX:
-        return []
-    ggaList.append(GGA_2) # 3
+        return None
+    gga.lat = GGA_2
     
     GGA_4, GGA_MAX = getIndexFrmName(sht_dr,GGA_4_DR,1)
     if GGA_4 == GGA_MAX:
-        return []
-    ggaList.append(GGA_4) # 4
+        return None
+    gga.lon = GGA_4
 
     GGA_6, GGA_MAX = getIndexFrmName(sht_gnss,GGA_6_GNSS,1)
     if GGA_6 == GGA_MAX:
-        return []
-    ggaList.append(GGA_6) # 5
+        return None
+    gga.fix = GGA_6
     
     GGA_7, GGA_MAX = getIndexFrmName(sht_gnss,GGA_7_GNSS,1)
     if GGA_7 == GGA_MAX:
-        return []
-    ggaList.append(GGA_7) # 6
+        return None
+    gga.sv_used = GGA_7
 
     GGA_8, GGA_MAX = getIndexFrmName(sht_gnss,GGA_8_GNSS,1)
     if GGA_8 == GGA_MAX:
-        return []
-    ggaList.append(GGA_8) # 7
+        return None
+    gga.hdop = GGA_8
 
     GGA_9, GGA_MAX = getIndexFrmName(sht_dr,GGA_9_DR_MSL,1)
-    if GGA_9 == GGA_MAX:
-        ggaList.append(0) # 8
-    else:
-        ggaList.append(GGA_9) # 8
+    if GGA_9 != GGA_MAX:
+        gga.msl = GGA_9
     
     GGA_11, GGA_MAX = getIndexFrmName(sht_dr,GGA_11_DR_WGS,1)
     if GGA_11 == GGA_MAX:
-        ggaList.append(0) # 9
-        if ggaList[8]:
+        if gga.msl:
             print(f'Orthometric height: MSL Altitude, Geoid height: ZERO')
         else:
             print(f'both MSL and WGS-84 Altitude not found in DR file')
-            return []
+            return None
     else:
-        ggaList.append(GGA_11) # 9
-        if ggaList[8]:
+        gga.wgs = GGA_11
+        if gga.msl:
             print(f'Orthometric height: MSL Altitude, Geoid height: (WGS-84 - MSL) Altitude')
         else:
             print(f'Orthometric height: WGS-84 Altitude, Geoid height: ZERO')
 
     GGA_13, GGA_MAX = getIndexFrmName(sht_gnss,GGA_13_GNSS,1)
     if GGA_13 == GGA_MAX:
-        return []
-    ggaList.append(GGA_13) # 10
+        return None
+    gga.age = GGA_13
     
     GGA_x, GGA_MAX = getIndexFrmName(sht_gnss,RMC_9_DR,1)
     if GGA_x == GGA_MAX:
-        return []
-    ggaList.append(GGA_x) # 11
+        return None
+    gga.gnss_week = GGA_x
     
     GGA_x, GGA_MAX = getIndexFrmName(sht_gnss,GGA_2_GNSS,1)
     if GGA_x == GGA_MAX:
-        return []
-    ggaList.append(GGA_x) # 12
+        return None
+    gga.gnss_lat = GGA_x
 
-    return ggaList
+    return gga
 
 def getIndexNameGSA(sht_gnss):
-    gsaList = []
+    gsa = GSALayout()
     print('checking GSA index name in XLSX...')
     GSA_2, GSA_MAX = getIndexFrmName(sht_gnss,GSA_2_GNSS,1)
     if GSA_2 == GSA_MAX:
-        return []
-    gsaList.append(GSA_2) # 0
+        return None
+    gsa.fix = GSA_2
 
     GSA_4, GSA_MAX = getIndexFrmName(sht_gnss,GSA_4_GNSS,1)
     if GSA_4 == GSA_MAX:
-        return []
-    gsaList.append(GSA_4) # 1
+        return None
+    gsa.pdop = GSA_4
     
     GSA_5, GSA_MAX = getIndexFrmName(sht_gnss,GSA_5_GNSS,1)
     if GSA_5 == GSA_MAX:
-        return []
-    gsaList.append(GSA_5) # 2
+        return None
+    gsa.hdop = GSA_5
     
     GSA_6, GSA_MAX = getIndexFrmName(sht_gnss,GSA_6_GNSS,1)
     if GSA_6 == GSA_MAX:
-        return []
-    gsaList.append(GSA_6) # 3
+        return None
+    gsa.vdop = GSA_6
 
-    return gsaList
+    return gsa
 
-def isValidFileGGA(sht_dr, sht_gnss, nameList):
+def isValidFileGGA(sht_dr, sht_gnss, gga):
     dr_lat = 0
     gnss_lat = 0
-    for i in range(2, DR_GNSS_LINE):
-        dr_time = sht_dr.cell(i,nameList[1]).value
-        dr_lat = sht_dr.cell(i,nameList[3]).value
+    gnss_rows = sht_gnss.rows(2, DR_GNSS_LINE-1)
+    for dr_vals in sht_dr.rows(2, DR_GNSS_LINE-1):
+        i = dr_vals[0]
+        gnss_vals = next(gnss_rows, None)
+        if gnss_vals is None:
+            return False
+        dr_time = dr_vals[gga.tow]
+        dr_lat = dr_vals[gga.lat]
         # I judge the DR and GNSS xlx should coming from
         # the same TitanINS HIPPO log by checking if the 
         # first DR_GNSS_LINE 'Time of Week' are the same xlsx index
@@ -527,11 +1713,11 @@ def isValidFileGGA(sht_dr, sht_gnss, nameList):
         # when there the DR and GNSS is coming from MBDR log
         # they different from the very beginning
         # as DR output is 20Hz, and GNSS output is 10Hz
-        gnss_time = sht_gnss.cell(i,nameList[2]).value
-        gnss_lat = sht_gnss.cell(i,nameList[12]).value
+        gnss_time = gnss_vals[gga.gnss_tow]
+        gnss_lat = gnss_vals[gga.gnss_lat]
         if gnss_time != dr_time: 
             if DBG_PRT:
-                print(f'{i}: DR({nameList[1]})-{dr_time}, GNSS({nameList[2]})-{gnss_time}')
+                print(f'{i}: DR({gga.tow})-{dr_time}, GNSS({gga.gnss_tow})-{gnss_time}')
             return False
     # all the GNSS related data are coming from GNSS.xlx
     # under the same time tag, the lat/lon/alt may different with DR.xls even it's TitanINS
@@ -542,48 +1728,28 @@ def isValidFileGGA(sht_dr, sht_gnss, nameList):
         print(f'lever arm (DR) position, not at antenna (GNSS)')
     return True
 
-def msgGGA(sht_dr, sht_gnss, nameList, dr_row, gnss_row):
-    time_tag = sht_dr.cell(dr_row,nameList[1]).value
-    gnss_r = gnss_row
-    
-    gga1 = getUTCtag(sht_dr.cell(dr_row,nameList[0]).value,time_tag)[11:]
-    gga1 = gga1[:2]+gga1[3:5]+gga1[6:]
-
-    gga2, gga3 = getPos(1, sht_dr.cell(dr_row, nameList[3]).value)
-
-    gga4, gga5 = getPos(0, sht_dr.cell(dr_row, nameList[4]).value)
-
-    t_match, gga6, gga7, gga8, gga13 = getGGAItemFrmGNSS(gnss_r, time_tag, 
-                                       nameList[2], nameList[5], nameList[6], 
-                                       nameList[7], nameList[10], sht_gnss)
-    if not t_match:
-        gnss_time_of_week = sht_gnss.cell(gnss_r,nameList[2]).value
-        if DBG_PRT:
-            print(f'Mismatch: DR-{dr_row}:{time_tag} GNSS-{gnss_r}:{gnss_time_of_week}')
-        if time_tag > gnss_time_of_week:
-            # only when DR xlx time tag is larger than GNSS time tag
-            # we need to keep searching the rest of GNSS xlx for the matching time tag
-            # when DR xlx time tage is smaller than GNSS time tag, it means
-            # GNSS has some missing period, just skip it
-            for gnss_i in range(gnss_r+1, sht_gnss.max_row+1):
-                t_match, gga6, gga7, gga8, gga13 = getGGAItemFrmGNSS(gnss_i, time_tag, 
-                                       nameList[2], nameList[5], nameList[6], 
-                                       nameList[7], nameList[10], sht_gnss)
-                if t_match:
-                    if DBG_PRT:
-                        print(f'Match: DR-{dr_row} GNSS-{gnss_i}')
-                    gnss_r = gnss_i + 1
-                    break
-    else:
-        gnss_r = gnss_r + 1
+def msgGGA(dr, k, gn, j, gga, gga1, lat, lon):
+    # DR row: dr[k], the matched GNSS row: gn[j] (j < 0: no match), lat/lon: see getPosList
+    col = dr.col
+    na = dr.na
+    # debug time tag, empty for NA
+    time_tag = '' if na[gga.tow][k] else col[gga.tow][k]
+
+    gga2, gga3 = lat
+
+    gga4, gga5 = lon
+
+    gga6, gga7, gga8, gga13 = getGGAItemFrmGNSS(gn, j, gga)
+    msl = gga.msl
+    wgs = gga.wgs
 
     # MSL vs WGS handling:
     #  9: Altitude (m MSL) [we may use "Altitude (m WGS-84)" here, and set item 11 to "0"]
     # 11: Altitude (m WGS-84) - Altitude (m MSL) [we may set here to "0", and use "Altitude (m WGS-84)" at item 9] 
-    if nameList[8] and nameList[9]:
-        gga9 = sht_dr.cell(dr_row, nameList[8]).value
-        gga11 = sht_dr.cell(dr_row, nameList[9]).value
-        if isNA(gga9) or isNA(gga11):
+    if msl and wgs:
+        gga9 = col[msl][k]
+        gga11 = col[wgs][k]
+        if na[msl][k] or na[wgs][k]:
             gga9 = ''
             gga10 = ''
             gga11 = ''
@@ -594,9 +1760,9 @@ def msgGGA(sht_dr, sht_gnss, nameList, dr_row, gnss_row):
             gga10 = 'M'
             gga11= str(round(gga11,6))
             gga12 = 'M'
-    elif nameList[8]:
-        gga9 = sht_dr.cell(dr_row, nameList[8]).value
-        if isNA(gga9):
+    elif msl:
+        gga9 = col[msl][k]
+        if na[msl][k]:
             gga9 = ''
             gga10 = ''
             gga11 = ''
@@ -607,8 +1773,8 @@ def msgGGA(sht_dr, sht_gnss, nameList, dr_row, gnss_row):
             gga11 = '0'
             gga12 = 'M'
     else:
-        gga11 = sht_dr.cell(dr_row, nameList[9]).value
-        if isNA(gga11):
+        gga11 = col[wgs][k]
+        if na[wgs][k]:
             gga9 = ''
             gga10 = ''
             gga11 = ''
@@ -619,79 +1785,73 @@ def msgGGA(sht_dr, sht_gnss, nameList, dr_row, gnss_row):
             gga11= '0'
             gga12 = 'M'
 
-    return gnss_r, t_match, GenNMEAMsg(DBG_PRT,time_tag,'GPGGA',
+    return GenNMEAMsg(DBG_PRT,time_tag,'GPGGA',
                                    gga1,gga2,gga3,gga4,gga5,
                                    gga6,gga7,gga8,
                                    gga9, gga10, gga11,gga12,
                                    gga13,'02')
 
 def getIndexNameRMC(sht_gnss):
-    rmcList = []
+    rmc = RMCLayout()
     print('checking RMC index name in XLSX...')
     RMC_1, RMC_MAX = getIndexFrmName(sht_gnss, RMC_1_DR,1)
     if RMC_1 == RMC_MAX:
-        return []
-    rmcList.append(RMC_1) # 0
+        return None
+    rmc.tow = RMC_1
     
     RMC_3, RMC_MAX = getIndexFrmName(sht_gnss,RMC_3_DR,1)
     if RMC_3 == RMC_MAX:
-        return []
-    rmcList.append(RMC_3) # 1
+        return None
+    rmc.lat = RMC_3
     
     RMC_5, RMC_MAX = getIndexFrmName(sht_gnss,RMC_5_DR,1)
     if RMC_5 == RMC_MAX:
-        return []
-    rmcList.append(RMC_5) # 2
+        return None
+    rmc.lon = RMC_5
     
     RMC_7, RMC_MAX = getIndexFrmName(sht_gnss,RMC_7_DR,1)
     if RMC_7 == RMC_MAX:
-        return []
-    rmcList.append(RMC_7) # 3
+        return None
+    rmc.speed = RMC_7
 
     RMC_8, RMC_MAX = getIndexFrmName(sht_gnss,RMC_8_DR,1)
     if RMC_8 == RMC_MAX:
-        return []
-    rmcList.append(RMC_8) # 4
+        return None
+    rmc.heading = RMC_8
 
     RMC_9, RMC_MAX = getIndexFrmName(sht_gnss,RMC_9_DR,1)
     if RMC_9 == RMC_MAX:
-        return []
-    rmcList.append(RMC_9) # 5
+        return None
+    rmc.week = RMC_9
 
-    return rmcList
+    return rmc
 
-def msgRMC(sht_gnss, nameList, dr_row):
-    time_tag = sht_gnss.cell(dr_row,nameList[0]).value
-    utc_iso = getUTCtag(sht_gnss.cell(dr_row,nameList[5]).value,time_tag)
-    if utc_iso == '':
+def msgRMC(gn, j, rmc, utc, lat, lon):
+    col = gn.col
+    na = gn.na
+    time_tag = '' if na[rmc.tow][j] else col[rmc.tow][j]
+    rmc1, rmc9 = utc # hhmmss.sss, ddmmyy
+    if rmc1 == '':
         return []
-    
-    rmc1 = utc_iso[11:]
-    rmc1 = rmc1[:2]+rmc1[3:5]+rmc1[6:]
 
-    rmc9 = utc_iso[:10]
-    rmc9 = rmc9[8:]+rmc9[5:7]+rmc9[2:4] #ddmmyy
+    rmc3, rmc4 = lat
 
-    rmc3, rmc4 = getPos(1, sht_gnss.cell(dr_row, nameList[1]).value)
-
-    rmc5, rmc6 = getPos(0, sht_gnss.cell(dr_row, nameList[2]).value)
+    rmc5, rmc6 = lon
 
     if rmc3 == '' or rmc4 == '' or rmc5 == '' or rmc6 == '':
         rmc2 = 'V'
     else:
         rmc2 = 'A'
 
-    rmc7 = sht_gnss.cell(dr_row, nameList[3]).value
-    if isNA(rmc7):
+    if na[rmc.speed][j]:
         rmc7 = ''
     else:
-        rmc7 = str(round(rmc7 * RMC_KNOTS,5))
+        rmc7 = str(round(col[rmc.speed][j] * RMC_KNOTS,5))
 
-    rmc8 = sht_gnss.cell(dr_row, nameList[4]).value
-    if isNA(rmc8):
+    if na[rmc.heading][j]:
         rmc8 = ''
     else:
-        rmc8 = str(rmc8)
+        rmc8 = str(col[rmc.heading][j])
 
     rmc10 = ''# Magnetic declination
     rmc11 = ''# Magnetic direction
@@ -700,59 +1860,77 @@ def msgRMC(sht_gnss, nameList, dr_row):
     return GenNMEAMsg(DBG_PRT,time_tag,'GNRMC',rmc1,rmc2,rmc3,rmc4,rmc5,rmc6,rmc7,rmc8,rmc9,rmc10,rmc11,rmc12)
 
 def getIndexNameGGAPlus(sht_dr, sht_gnss):# 0:error,1:ok,2:gnss only
-    nameList = getIndexNameGGA(sht_dr, sht_gnss)
-    if nameList == []:
+    gga = getIndexNameGGA(sht_dr, sht_gnss)
+    if gga is None:
         print('index name error')
-        return 0,[]
+        return 0,None
     else:
         print('done')
     
-    if not isValidFileGGA(sht_dr, sht_gnss, nameList):
+    if not isValidFileGGA(sht_dr, sht_gnss, gga):
         print(f'the output will only use GNSS file information')
-        nameList = getIndexNameGGA(sht_gnss, sht_gnss)
-        return 2,nameList
+        gga = getIndexNameGGA(sht_gnss, sht_gnss)
+        return 2,gga
     else:
-        return 1,nameList
+        return 1,gga
 
 def getGSVNameList(sht_gnss):
+    # -> 1 and [SVLayout, ...] in the GSV order (SBAS goes with GPS), 0 when no SV is found
     print('checking GSV index name in XLSX...')
-    gps_title_list = getSVLsFrmGNSS(GPS_START,GPS_END,sht_gnss)
-    if gps_title_list == []:
+    gps_title_list = getSVLsFrmGNSS(GPS_START,GPS_END,sht_gnss,'GP')
+    if gps_title_list is None:
         print('no GPS')
     
-    glonass_title_list = getSVLsFrmGNSS(GLONASS_START,GLONASS_END,sht_gnss)
-    if glonass_title_list == []:
+    glonass_title_list = getSVLsFrmGNSS(GLONASS_START,GLONASS_END,sht_gnss,'GL')
+    if glonass_title_list is None:
         print('no GLONASS')
     
-    sbas_title_list = getSVLsFrmGNSS(SBAS_START,SBAS_END,sht_gnss)
-    if sbas_title_list == []:
+    sbas_title_list = getSVLsFrmGNSS(SBAS_START,SBAS_END,sht_gnss,'GP')
+    if sbas_title_list is None:
         print('no SBAS')
     
-    galileo_title_list = getSVLsFrmGNSS(GALILEO_START,GALILEO_END,sht_gnss)
-    if galileo_title_list == []:
+    galileo_title_list = getSVLsFrmGNSS(GALILEO_START,GALILEO_END,sht_gnss,'GA')
+    if galileo_title_list is None:
         print('no GALILEO')
     
-    qzss_title_list = getSVLsFrmGNSS(QZSS_START,QZSS_END,sht_gnss)
-    if qzss_title_list == []:
+    qzss_title_list = getSVLsFrmGNSS(QZSS_START,QZSS_END,sht_gnss,'GQ')
+    if qzss_title_list is None:
         print('no QZSS')
     
-    beidou_title_list = getSVLsFrmGNSS(BEIDOU_START,BEIDOU_END,sht_gnss)
-    if beidou_title_list == []:
+    beidou_title_list = getSVLsFrmGNSS(BEIDOU_START,BEIDOU_END,sht_gnss,'GB')
+    if beidou_title_list is None:
         print('no BEIDOU')
 
-    if gps_title_list == [] and \
-       glonass_title_list == [] and \
-       sbas_title_list == [] and \
-       galileo_title_list == [] and \
-       qzss_title_list == [] and \
-       beidou_title_list == []:
+    gsv_l = [l for l in (gps_title_list, sbas_title_list, glonass_title_list,
+                         galileo_title_list, qzss_title_list, beidou_title_list) if l]
+    if gsv_l == []:
         print('invalid XLSX')
-        return 0,[],[],[],[],[],[]
+        return 0,[]
     
     print('done')
 
-    return 1,gps_title_list,glonass_title_list,sbas_title_list, \
-           galileo_title_list,qzss_title_list,beidou_title_list
+    return 1,gsv_l
+
+def getColType(gga, rmc, gsa, gsv_l):
+    # the columns referenced by the sentences, and how they are loaded (see ColChunk)
+    dr_col = {gga.week: 'q', gga.tow: 'd', gga.lat: 'd', gga.lon: 'd'}
+    if gga.msl:
+        dr_col[gga.msl] = 'd'
+    if gga.wgs:
+        dr_col[gga.wgs] = 'd'
+
+    gnss_col = {gga.fix: '', gga.sv_used: 'q', gga.hdop: 'd', gga.age: ''}
+    if rmc:
+        gnss_col.update({rmc.tow: 'd', rmc.lat: 'd', rmc.lon: 'd',
+                         rmc.speed: 'd', rmc.heading: '', rmc.week: 'q'})
+    if gsa:
+        gnss_col.update({gsa.fix: '', gsa.pdop: 'd', gsa.hdop: 'd', gsa.vdop: 'd'})
+    for svl in gsv_l:
+        for sv, used, elev, azim, cno1, name1, cno2, name2 in svl.sv:
+            for c in (used, cno1, cno2, azim, elev):
+                if c:
+                    gnss_col[c] = ''
+    return dr_col, gnss_col
 
 def validType(inputT):
     if inputT == 'GGA' or inputT == 'RMC' or \
@@ -801,26 +1979,113 @@ def findType(iType, lType):
             return True
     return False
 
-def internalGSVandGSA(msg,gsa_l,gsv_type,gsv_list,sht_row,sht_g):
-    gsv_msg = msgGSV(gsv_type, gsv_list, sht_row, sht_g)
+def svInfoRowGSV(gsv_l, gn, j):
+    """
+    satellite snapshot of one GNSS row: [(gsv_type, svInfoLst), ...]
+    it's read once, then shared by all the satellite sentences (GSV, GSA)
+    """
+    return [(svl.gsv_type, svInfoLstGSV(svl,gn,j)) for svl in gsv_l]
+
+def internalGSVandGSA(msg,gsa_l,gsv_type,svInfoLst,gn,j):
+    gsv_msg = msgGSV(gsv_type, svInfoLst)
     if gsv_msg != [] and gsv_msg:
         for m in gsv_msg:
             msg.append(m)
-        gsa_msg = msgGSA(gsa_l, gsv_list, sht_row, sht_g)
+        gsa_msg = msgGSA(gsa_l, svInfoLst, gn, j)
         if gsa_msg != []:
             for m in gsa_msg:
                 msg.append(m)
 
-def msgGSVandGSA(msg,gsa_l,gsv_gps_l,gsv_glonass_l,gsv_sbas_l,gsv_galileo_l,gsv_qzss_l,gsv_beidou_l,sht_row,sht_g):
+def msgGSVandGSA(msg,gsa,gsv_l,gn,j):
+    for gsv_type, svInfoLst in svInfoRowGSV(gsv_l, gn, j):
+        internalGSVandGSA(msg,gsa,gsv_type,svInfoLst,gn,j)
 
-    internalGSVandGSA(msg,gsa_l,'GP',gsv_gps_l,sht_row,sht_g)
-    internalGSVandGSA(msg,gsa_l,'GP',gsv_sbas_l,sht_row,sht_g)
-    internalGSVandGSA(msg,gsa_l,'GL',gsv_glonass_l,sht_row,sht_g)
-    internalGSVandGSA(msg,gsa_l,'GA',gsv_galileo_l,sht_row,sht_g)
-    internalGSVandGSA(msg,gsa_l,'GQ',gsv_qzss_l,sht_row,sht_g)
-    internalGSVandGSA(msg,gsa_l,'GB',gsv_beidou_l,sht_row,sht_g)
+def chunk2nmea(layout, dr_chunk, gnss_chunk, gnss_j, prof=None, epochs=None):
+    """
+    NMEA sentences of an aligned chunk
+    dr_chunk[k] is matched to gnss_chunk[gnss_j[k]] (gnss_j[k] < 0: no GNSS)
+    prof: {stage: sec} the stage time is added to (see ConvProfile)
+    epochs: list to get the end of each DR row sentences in the returned list
+    """
+    gga = layout.gga
+    rmc = layout.rmc
+    gsa = layout.gsa
+    gsv_l = layout.gsv
+    msg = []
+    if prof is None:
+        prof = dict.fromkeys(PROF_STAGE_List, 0.0)
+    clock = time.perf_counter
+
+    t0 = clock()
+    dr = ColChunk(dr_chunk, layout.dr_col)
+    gn = ColChunk(gnss_chunk, layout.gnss_col)
+    t1 = clock()
+    prof['columns'] += t1 - t0
+
+    gga_utc = getUTCtagList(dr.col[gga.week], dr.col[gga.tow], dr.na[gga.week], dr.na[gga.tow])
+    if rmc:
+        rmc_utc = getUTCtagList(gn.col[rmc.week], gn.col[rmc.tow], gn.na[rmc.week], gn.na[rmc.tow])
+    t0 = clock()
+    prof['utc'] += t0 - t1
+
+    gga_lat = getPosList(1, dr.col[gga.lat], dr.na[gga.lat])
+    gga_lon = getPosList(0, dr.col[gga.lon], dr.na[gga.lon])
+    if rmc:
+        rmc_lat = getPosList(1, gn.col[rmc.lat], gn.na[rmc.lat])
+        rmc_lon = getPosList(0, gn.col[rmc.lon], gn.na[rmc.lon])
+    t1 = clock()
+    prof['pos'] += t1 - t0
+    t0 = t1
+
+    t_gga = t_rmc = t_gsv = 0.0
+    for k in range(dr.len):
+        j = gnss_j[k]
+        msg.append(msgGGA(dr, k, gn, j, gga, gga_utc[k][0], gga_lat[k], gga_lon[k]))
+        t1 = clock()
+        t_gga += t1 - t0
+        t0 = t1
+
+        if j >= 0:
+            if rmc:
+                rmc_msg = msgRMC(gn,j,rmc,rmc_utc[j],rmc_lat[j],rmc_lon[j])
+                if rmc_msg != []:
+                    msg.append(rmc_msg)
+                t1 = clock()
+                t_rmc += t1 - t0
+                t0 = t1
+
+            if gsv_l:
+                msgGSVandGSA(msg,gsa,gsv_l,gn,j)
+                t1 = clock()
+                t_gsv += t1 - t0
+                t0 = t1
+        if epochs is not None:
+            epochs.append(len(msg))
+    prof['GGA'] += t_gga
+    prof['RMC'] += t_rmc
+    prof['GSV/GSA'] += t_gsv
+    return msg
 
-def sht2nmea(p_dr, p_gnss, n_type):
+# layout of the conversion in the worker process, see initChunkWorker
+WORKER_LAYOUT = {}
+
+def initChunkWorker(layout, dbg):
+    global WORKER_LAYOUT, DBG_PRT
+    WORKER_LAYOUT = layout
+    DBG_PRT = dbg
+
+def chunkWorker(dr_chunk, gnss_chunk, gnss_j, shard=False):
+    # -> NMEA lines of the chunk (shard: see shardBlock), {stage: sec}
+    prof = dict.fromkeys(PROF_STAGE_List, 0.0)
+    if shard:
+        epochs = []
+        msg = chunk2nmea(WORKER_LAYOUT, dr_chunk, gnss_chunk, gnss_j, prof, epochs)
+        return shardBlock(msg, epochs, dr_chunk, WORKER_LAYOUT.gga), prof
+    block = NmeaBlock(chunk2nmea(WORKER_LAYOUT, dr_chunk, gnss_chunk, gnss_j, prof))
+    return block, prof
+
+def sht2nmea(p_dr, p_gnss, n_type, fl_name='', compress=None, tol=None, jobs=1, cache=False,
+             profile='', incremental=False, window=None, shard=None, pipeline=False):
     tList = getTypeList(n_type)
     if tList == []:
         return
@@ -829,135 +2094,831 @@ def sht2nmea(p_dr, p_gnss, n_type):
         print(f'please input necessary XLSX file')
         return
 
-    sht_dr, sht_gnss = xlsx2sht(p_dr, p_gnss)
+    prof = ConvProfile()
+    with prof.stage('load'):
+        sht_dr, sht_gnss = xlsx2sht(p_dr, p_gnss, cache)
     if not sht_dr or not sht_gnss:
+        xlsxClose(sht_dr, sht_gnss)
         return
 
+    try:
+        res = convertSht(sht_dr, sht_gnss, tList, fl_name, compress, tol, jobs, prof, incremental, window,
+                         shard, pipeline)
+    finally:
+        xlsxClose(sht_dr, sht_gnss)
+    if res and profile != '':
+        prof.report(res['stat'])
+        prof.dump(profile, res['stat'])
+        print(f'profile: {profile}')
+    return res
+
+def convertSht(sht_dr, sht_gnss, tList, fl_name='', compress=None, tol=None, jobs=1, prof=None,
+               incremental=False, window=None, shard=None, pipeline=False):
+    """
+    returns {'out': NMEA file, 'rows': converted rows, 'gnss_only': 0/1,
+             'stat': DR/GNSS time alignment (see TimeAlign),
+             'profile': stage time and counters (see ConvProfile)}
+    None when the xlsx is not valid
+    prof: ConvProfile to carry on (the load time, etc.)
+    incremental: only the rows after the checkpoint (<fl_name>.ckpt) are added to fl_name,
+    the DR rows after the last GNSS row wait for the next time
+    window: (start, end, rate) of the DR rows, see RowWindow, None for all the rows
+    shard: (span sec, size bytes) to split the NMEA file, see ShardWriter, None for one file
+    then 'out' is the manifest and 'shards' the NMEA files
+    pipeline: the DR/GNSS rows are read and the NMEA written in their own threads (see threadIter, PipeWriter)
+    """
+    if prof is None:
+        prof = ConvProfile()
+    with prof.stage('index'):
+        layout = getLayout(sht_dr, sht_gnss, tList)
+    if not layout:
+        return
+    return convertLayout(sht_dr, sht_gnss, layout, fl_name, compress, tol, jobs, prof, incremental, window,
+                         shard, pipeline)
+
+def getLayout(sht_dr, sht_gnss, tList):
+    """
+    columns of the sentences in tList (ConvLayout), see chunk2nmea(), None when not found
+    """
     type_num = len(tList)
-    l_gga_name = []
-    l_rmc_name = []
-    l_gsa_name  = []
-    l_gps_name  = []
-    l_glonass_name= []
-    l_sbas_name = []
-    l_galileo_name= []
-    l_qzss_name = []
-    l_beidou_name=[]
-    tmp_sht = sht_dr
-    gnss_ret = 1# 0:error,1:ok,2:gnss only
+    rmc = None
+    gsa = None
+    gsv_l = []
 
     # make GGA default option
-    gnss_ret,l_gga_name = getIndexNameGGAPlus(sht_dr, sht_gnss)
+    gnss_ret,gga = getIndexNameGGAPlus(sht_dr, sht_gnss)
     if not gnss_ret:
         return
-    elif gnss_ret == 2:
-        tmp_sht = sht_gnss
+
+    # the logs of the same receiver firmware have the same titles, so the
+    # same layout, no need to look for the SV columns again
+    key = layoutKey(sht_dr, sht_gnss, tList, gnss_ret)
+    cache = loadLayoutCache()
+    layout = dataLayout(cache.get(key))
+    if layout and repr(layout.gga) == repr(gga):
+        print('column layout from the cache')
+        return layout
 
     # check other options
     for i in range(type_num):
         if tList[i] == 'RMC':
-            l_rmc_name = getIndexNameRMC(sht_gnss)
-            if l_rmc_name == []:
+            rmc = getIndexNameRMC(sht_gnss)
+            if rmc is None:
                 print('index name error')
                 return
         # for GSV and GSA: there is possible only output GSV
         # but whenever there is GSA, there is a GSV
         # since GSA needs to base on GSV's information
         if tList[i] == 'GSV' or tList[i] == 'GSA':
-            if l_gps_name == [] and l_glonass_name == [] and \
-               l_sbas_name == [] and l_galileo_name == [] and \
-               l_qzss_name == [] and l_beidou_name == []:
-                ret, l_gps_name,l_glonass_name,l_sbas_name, \
-                l_galileo_name,l_qzss_name,l_beidou_name = getGSVNameList(sht_gnss)
+            if gsv_l == []:
+                ret, gsv_l = getGSVNameList(sht_gnss)
                 if not ret:
                     return
             if tList[i] == 'GSA':
-                l_gsa_name = getIndexNameGSA(sht_gnss)
-                if l_gsa_name == []:
+                gsa = getIndexNameGSA(sht_gnss)
+                if gsa is None:
                     print('index name error')
                     return
-    
-    if DBG_PRT:
+
+    dr_col, gnss_col = getColType(gga, rmc, gsa, gsv_l)
+    layout = ConvLayout(gga=gga, rmc=rmc, gsa=gsa, gsv=gsv_l,
+                        dr_col=dr_col, gnss_col=gnss_col, gnss_ret=gnss_ret)
+    cache[key] = layoutData(layout)
+    saveLayoutCache(cache)
+    return layout
+
+def layoutData(layout):
+    # ConvLayout -> JSON types only (see saveLayoutCache)
+    data = layout.data()
+    data['gga'] = layout.gga.data()
+    data['rmc'] = layout.rmc.data() if layout.rmc else None
+    data['gsa'] = layout.gsa.data() if layout.gsa else None
+    data['gsv'] = [svl.data() for svl in layout.gsv]
+    return data
+
+def dataLayout(data):
+    # layoutData() (from JSON: str column keys, lists) -> ConvLayout, None when it's not a layout
+    try:
+        return ConvLayout(**dict(data, gga=GGALayout(**data['gga']),
+                                 rmc=RMCLayout(**data['rmc']) if data['rmc'] else None,
+                                 gsa=GSALayout(**data['gsa']) if data['gsa'] else None,
+                                 gsv=[SVLayout(gsv_type=d['gsv_type'], sv=tuple(map(tuple, d['sv'])))
+                                      for d in data['gsv']],
+                                 dr_col={int(c): t for c, t in data['dr_col'].items()},
+                                 gnss_col={int(c): t for c, t in data['gnss_col'].items()}))
+    except (TypeError, KeyError, ValueError, AttributeError):
+        return None
+
+def layoutKey(sht_dr, sht_gnss, tList, gnss_ret):
+    # hash of the title rows and the sentences
+    h = hashlib.blake2b(digest_size=16)
+    h.update(repr((xver, sht_dr.title, sht_gnss.title, sorted(set(tList)), gnss_ret)).encode('utf-8'))
+    return h.hexdigest()
+
+def loadLayoutCache():
+    # {layoutKey: layoutData}, the oldest first
+    if LAYOUT_CACHE == '':
+        return {}
+    try:
+        with open(LAYOUT_CACHE, 'rt', encoding='utf-8') as f:
+            cache = lazyImport('json').load(f)
+        if isinstance(cache, dict):
+            return cache
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        # a broken cache is built again
+        print(f'layout cache error: {e}')
+    return {}
+
+def saveLayoutCache(cache):
+    if LAYOUT_CACHE == '':
+        return
+    while len(cache) > LAYOUT_CACHE_MAX:
+        del cache[next(iter(cache))]
+    # the batch worker processes may save it at the same time
+    # JSON, no pickle: the file is only read as data, a broken one is built again
+    tmp = LAYOUT_CACHE + '.' + str(os.getpid())
+    try:
+        os.makedirs(os.path.dirname(LAYOUT_CACHE), exist_ok=True)
+        with open(tmp, 'wt', encoding='utf-8') as f:
+            lazyImport('json').dump(cache, f)
+        os.replace(tmp, LAYOUT_CACHE)
+    except OSError as e:
+        print(f'layout cache error: {e}')
+
+def useLayout(sht_dr, sht_gnss, layout):
+    # only the columns in use are parsed (xlx), -> the sheet of the DR rows
+    gga = layout.gga
+    tmp_sht = sht_gnss if layout.gnss_ret == 2 else sht_dr
+    gnss_use = list(layout.gnss_col) + [gga.gnss_tow, gga.gnss_week]
+    dr_use = list(layout.dr_col) + [gga.week, gga.tow]
+    if tmp_sht is sht_gnss:
+        gnss_use += dr_use
+    sht_gnss.useColumns(gnss_use)
+    if tmp_sht is not sht_gnss:
+        tmp_sht.useColumns(dr_use)
+    return tmp_sht
+
+def layoutWindow(layout, window):
+    """
+    (DR RowWindow, GNSS RowWindow) of window (start, end, rate), (None, None) for all the rows
+    the GNSS rows are read a bit over the DR time window to match the first/last DR rows
+    """
+    start, end, rate = window or (None, None, 0)
+    start = parseGPSTime(start)
+    end = parseGPSTime(end)
+    if not start and not end and not rate:
+        return None, None
+    gga = layout.gga
+    dr_window = RowWindow(gga.week, gga.tow, start, end, rate)
+    gnss_window = None
+    if start or end:
+        gnss_window = RowWindow(gga.gnss_week, gga.gnss_tow,
+                                start and (start[0], start[1] - WINDOW_GNSS_MARGIN),
+                                end and (end[0], end[1] + WINDOW_GNSS_MARGIN))
+    return dr_window, gnss_window
+
+def convertLayout(sht_dr, sht_gnss, layout, fl_name, compress, tol, jobs, prof, incremental=False,
+                  window=None, shard=None, pipeline=False):
+    gga = layout.gga
+    gnss_ret = layout.gnss_ret
+    tmp_sht = sht_gnss if gnss_ret == 2 else sht_dr
+
+    if compress is None:
+        compress = NMEA_COMPRESS
+    if fl_name == '' and DBG_PRT:
         fl_name = 'Debug-v' + str(xver) + datetime.now().strftime('-%Y-%b-%d_%H.%M.%S.txt')
-    else: 
+    elif fl_name == '':
         fl_name = 'NMEA-v' + str(xver) + datetime.now().strftime('-%Y-%b-%d_%H.%M.%S.txt')
-    with open(fl_name, 'wt') as nmea_log:
-        print(f'{fl_name} created')
+    if compress and not fl_name.endswith('.' + compress):
+        fl_name += '.' + compress
+    ckpt = None
+    if incremental:
+        ckpt_key = getCkptKey(sht_dr, sht_gnss, layout, compress, window)
+        ckpt = loadCkpt(fl_name, ckpt_key, tmp_sht, gga)
+    if shard:
+        nmea_log = ShardWriter(fl_name, compress, *shard)
+    else:
+        nmea_log = NmeaWriter(fl_name, compress, mode='ab' if ckpt else 'wb')
+    if pipeline:
+        nmea_log = PipeWriter(nmea_log)
+    with nmea_log:
+        if ckpt:
+            print(f"{fl_name}: from DR row {ckpt['dr_row']+1}, GNSS row {ckpt['gnss_row']}")
+        elif shard:
+            print(f'{nmea_log.manifest} created')
+        else:
+            print(f'{fl_name} created')
 
-        gnss_row = 2 # skip the title row
-        msg = []
-        gga_match = 0
+        # the rows before are already in the NMEA file (incremental mode)
+        sht_row = ckpt['dr_row'] if ckpt else 1
+        dr_time = ckpt['dr_time'] if ckpt else None
+        gnss_row = ckpt['gnss_row'] if ckpt else 2
 
         max_row = tmp_sht.max_row
+        useLayout(sht_dr, sht_gnss, layout)
+        # the rows out of the time window are skipped by the readers
+        dr_window, gnss_window = layoutWindow(layout, window)
+        # the checkpoint and the debug lines need the exact row numbers
+        for w in (dr_window, gnss_window):
+            if w:
+                w.count_rows = bool(incremental or DBG_PRT)
+        if dr_window and dr_time:
+            dr_window.seed(*dr_time)
+        gnss_rows = sht_gnss.rows(gnss_row, window=gnss_window)
+        readers = []
+        if pipeline:
+            # the GNSS rows are read ahead in chunks as well
+            readers.append(threadIter(rowChunks(gnss_rows, CHUNK_ROW)))
+            gnss_rows = itertools.chain.from_iterable(readers[-1])
+        gnss_align = TimeAlign(gnss_rows, gga, tol, gnss_row, incremental)
+        if ckpt:
+            gnss_align.stat.update(ckpt['stat'])
+
+        def writeResult(fut):
+            block, t = fut.result()
+            prof.add(t)
+            with prof.stage('write'):
+                nmea_log.writeBlock(block)
+
+        # the DR/GNSS alignment has to go in time order, it stays here
+        # each aligned chunk can be converted on its own (in the workers when jobs > 1)
+        pool = None
+        if jobs > 1:
+            pool = lazyImport('concurrent.futures').ProcessPoolExecutor(jobs, initializer=initChunkWorker, initargs=(layout, DBG_PRT))
+            pending = deque()
+        try:
+            # skip the title row, so start from 2
+            dr_chunks = rowChunks(tmp_sht.rows(sht_row+1, window=dr_window), CHUNK_ROW)
+            if pipeline:
+                dr_chunks = threadIter(dr_chunks)
+                readers.append(dr_chunks)
+            while 1:
+                with prof.stage('load'):
+                    dr_chunk = next(dr_chunks, None)
+                if dr_chunk is None:
+                    break
+                prof.progress(dr_chunk[-1][0], max_row)
+
+                with prof.stage('align'):
+                    gnss_chunk, gnss_j = gnss_align.align(dr_chunk)
+                held = len(gnss_j) < len(dr_chunk)
+                if held:
+                    # incremental mode: the rest waits for the GNSS rows of the next time
+                    dr_chunk = dr_chunk[:len(gnss_j)]
+                    if not dr_chunk:
+                        break
+                sht_row = dr_chunk[-1][0]
+                dr_time = [dr_chunk[-1][gga.week], dr_chunk[-1][gga.tow]]
+                prof.count['rows'] += len(dr_chunk)
+                prof.count['chunks'] += 1
+                if pool:
+                    pending.append(pool.submit(chunkWorker, dr_chunk, gnss_chunk, gnss_j, bool(shard)))
+                    # keep the output in the row order, and only a few chunks in flight
+                    while len(pending) > jobs*2 or (pending and pending[0].done()):
+                        writeResult(pending.popleft())
+                elif shard:
+                    epochs = []
+                    msg = chunk2nmea(layout, dr_chunk, gnss_chunk, gnss_j, prof.t, epochs)
+                    with prof.stage('write'):
+                        nmea_log.writeBlock(shardBlock(msg, epochs, dr_chunk, gga))
+                else:
+                    msg = chunk2nmea(layout, dr_chunk, gnss_chunk, gnss_j, prof.t)
+                    with prof.stage('write'):
+                        msgLstWrNMEA(msg,nmea_log)
+                if held:
+                    break
 
-        # skip the title row, so start from 2
-        # max_row is the row number, the "for loop" index should be plus 1
-        for sht_row in range(2, max_row+1): 
-            print(f'process: {round(((sht_row+1)/max_row)*100,1)}%', end= '\r')
-
-            if l_gga_name != []:
-                gnss_row, gga_match, gga_msg = msgGGA(tmp_sht, sht_gnss, l_gga_name, sht_row, gnss_row)
-                msg.append(gga_msg)
-
-            if gga_match:
-                if l_rmc_name != []:
-                    # when matched, gnss row will plus 1, so minus 1 is needed for current location
-                    rmc_msg = msgRMC(sht_gnss,l_rmc_name,gnss_row-1)
-                    if rmc_msg != []:
-                        msg.append(rmc_msg)
-
-                if l_gps_name != [] or l_glonass_name != [] or \
-                   l_sbas_name != [] or l_galileo_name != [] or \
-                   l_qzss_name != [] or l_beidou_name != [] or \
-                   l_gsa_name != []:
-                    # when matched, gnss row will plus 1, so minus 1 is needed for current location
-                    msgGSVandGSA(msg,l_gsa_name, \
-                                 l_gps_name,l_glonass_name, \
-                                 l_sbas_name,l_galileo_name, \
-                                 l_qzss_name,l_beidou_name, \
-                                 gnss_row-1, sht_gnss)
-            
-            msgLstWrNMEA(msg,nmea_log)
-            msg = []
-
-    end_msg = 'converted ' + str(sht_row-1) + ' lines in '# the first title line needs to be removed
+            while pool and pending:
+                writeResult(pending.popleft())
+        finally:
+            if pool:
+                pool.shutdown(cancel_futures=True)
+            for reader in readers:
+                reader.close()
+        with prof.stage('write'):
+            nmea_log.flush()
+        prof.count['sentences'] = nmea_log.lines
+        prof.count['bytes'] = nmea_log.total
+    stat = gnss_align.stat
+    out = fl_name
+    if shard:
+        out = nmea_log.manifest
+        print(f'{len(nmea_log.shards)} NMEA files, manifest: {out}')
+    if incremental:
+        saveCkpt(fl_name, ckpt_key, sht_row, dr_time, gnss_align.cur.nextRow(), stat)
+
+    rows = prof.count['rows']
+    end_msg = 'converted ' + str(rows) + ' lines in '
     if gnss_ret == 2:
         end_msg += 'GNSS file to NMEA.'
     else:
         end_msg += 'DR file to NMEA.'
         
     print(end_msg)
+    print(f"DR/GNSS time: {stat['match']} matched, {stat['mismatch']} DR rows without GNSS, "
+          f"{stat['gnss_skip']} GNSS rows skipped, {stat['time_na']} DR rows without time")
+
+    res = {'out': out, 'rows': rows, 'gnss_only': int(gnss_ret == 2), 'stat': stat,
+           'profile': prof.result(stat)}
+    if shard:
+        res['shards'] = nmea_log.files()
+    return res
+
+def getCkptKey(sht_dr, sht_gnss, layout, compress, window=None):
+    # the checkpoint is only for the same titles/sentences/output/time window
+    h = hashlib.blake2b(digest_size=16)
+    h.update(repr((sht_dr.title, sht_gnss.title, layout.gga, layout.rmc, layout.gsa,
+                   layout.gsv, DBG_PRT, compress, xver, window)).encode('utf-8'))
+    return h.hexdigest()
+
+def rowTime(sht, row, gga):
+    # [week, time of week] of a DR row, None when there is no such row
+    for vals in sht.rows(row, row):
+        return [vals[gga.week], vals[gga.tow]]
+    return None
+
+def loadCkpt(fl_name, key, tmp_sht, gga):
+    """
+    checkpoint of the NMEA file, None to convert from the beginning:
+    no checkpoint, other titles/sentences, the NMEA file changed since,
+    or the last DR row converted is not the same (not the same log)
+    """
+    try:
+        with open(fl_name + CKPT_EXT, 'rt') as f:
+            ckpt = lazyImport('json').load(f)
+        if ckpt.get('ver') != CKPT_VER or ckpt.get('key') != key:
+            print('checkpoint is for other xlx/sentences, convert from the beginning')
+            return None
+        if os.path.getsize(fl_name) != ckpt['out_size']:
+            print(f'{fl_name} changed since the checkpoint, convert from the beginning')
+            return None
+    except (OSError, ValueError, KeyError):
+        return None
+    if ckpt['dr_row'] > 1 and rowTime(tmp_sht, ckpt['dr_row'], gga) != ckpt['dr_time']:
+        print('DR rows changed since the checkpoint, convert from the beginning')
+        return None
+    return ckpt
+
+def saveCkpt(fl_name, key, dr_row, dr_time, gnss_row, stat):
+    # dr_row: the last DR row converted ([week, time of week] of it), gnss_row: the next GNSS row to match
+    ckpt = {'ver': CKPT_VER, 'key': key, 'dr_row': dr_row, 'dr_time': dr_time,
+            'gnss_row': gnss_row, 'out_size': os.path.getsize(fl_name), 'stat': stat}
+    tmp = fl_name + CKPT_EXT + '.tmp'
+    with open(tmp, 'wt') as f:
+        lazyImport('json').dump(ckpt, f, indent=1)
+    os.replace(tmp, fl_name + CKPT_EXT)
+
+def convert(p_dr, p_gnss='', n_type='GGA', out='', debug=False, compress=None, tol=None, jobs=1,
+            cache=False, profile='', incremental=False, start=None, end=None, rate=0, shard_time=0,
+            shard_size=0, pipeline=False):
+    """
+    convert the DR/GNSS xlsx into NMEA file, for the scripts and pipelines
+
+    p_gnss: '' to use the p_dr file only (GNSS xlsx)
+    n_type: GGA/RMC/GSV/GSA, joined by '+', e.g. 'GGA+RMC+GSV'
+    out: NMEA file name, '' for the default 'NMEA-v<ver>-<time>.txt'
+    compress: '', 'gz' or 'xz' (None: NMEA_COMPRESS)
+    tol: DR/GNSS time match tolerance in sec (None: ALIGN_TOL)
+    jobs: worker processes converting the row chunks (1: no worker)
+    cache: parse the xlsx/xlx once into <file>.x2n and reuse it while the file is unchanged
+    profile: JSON file for the stage time and counters (see ConvProfile), '' for none
+    incremental: only add the new rows of a growing log to out (checkpoint: <out>.ckpt)
+    start/end: GPS time window of the DR rows, 'week:time of week', 'time of week' (the week of
+    the first row) or (week, time of week), None for no limit
+    rate: output rows per second (decimation, the first row from each 1/rate sec), 0 for all the rows
+    shard_time/shard_size: split the NMEA file every shard_time sec of GPS time and/or shard_size bytes,
+    with a manifest (see ShardWriter), 0 for no split
+    pipeline: read the xlsx/xlx and write the NMEA in their own threads, while converting
+    returns the same dict as convertSht(), None when failed
+
+    the column layout is read from and saved to LAYOUT_CACHE (~/.xlx2nmea/layout.cache),
+    set xlx2nmea.LAYOUT_CACHE = '' to leave the home directory alone
+    """
+    global DBG_PRT
+    if p_gnss == '':
+        p_gnss = p_dr
+    if compress is not None and compress not in NMEA_COMPRESS_List:
+        print(f'invalid compress: {compress}')
+        return None
+    if incremental and out == '':
+        print('incremental mode needs the NMEA file name')
+        return None
+    try:
+        parseGPSTime(start)
+        parseGPSTime(end)
+    except (TypeError, ValueError):
+        print(f'invalid time: {start}, {end} (week:time of week or time of week)')
+        return None
+    if rate < 0:
+        print(f'invalid rate: {rate}')
+        return None
+    window = (start, end, rate) if start or end or rate else None
+    if shard_time < 0 or shard_size < 0:
+        print(f'invalid shard time/size: {shard_time}, {shard_size}')
+        return None
+    shard = (shard_time, shard_size) if shard_time or shard_size else None
+    if shard and incremental:
+        print('incremental mode writes one NMEA file, no shard')
+        return None
+    DBG_PRT = 1 if debug else 0
+    return sht2nmea(p_dr, p_gnss, n_type, out, compress, tol, jobs, cache, profile, incremental, window, shard,
+                    pipeline)
+
+def nmeaEpochs(sht_dr, sht_gnss, layout, tol=None, stat=None, window=None):
+    """
+    streaming conversion -> (GPS time in sec, [sentences]) of each DR row, in the row order
+    the time is None when the DR row has no time
+    stat: dict to get the DR/GNSS time alignment counters (see TimeAlign)
+    window: (start, end, rate) of the DR rows, see RowWindow, None for all the rows
+    """
+    gga = layout.gga
+    tmp_sht = useLayout(sht_dr, sht_gnss, layout)
+    dr_window, gnss_window = layoutWindow(layout, window)
+    gnss_align = TimeAlign(sht_gnss.rows(window=gnss_window), gga, tol)
+    if stat is not None:
+        gnss_align.stat = stat
+        stat.update(dict.fromkeys(['match', 'mismatch', 'gnss_skip', 'time_na', 'scan', 'scan_max'], 0))
+    for dr_chunk in rowChunks(tmp_sht.rows(window=dr_window), CHUNK_ROW):
+        gnss_chunk, gnss_j = gnss_align.align(dr_chunk)
+        epochs = []
+        msg = chunk2nmea(layout, dr_chunk, gnss_chunk, gnss_j, epochs=epochs)
+        start = 0
+        for dr_vals, end in zip(dr_chunk, epochs):
+            yield gpsSec(dr_vals[gga.week], dr_vals[gga.tow]), msg[start:end]
+            start = end
+
+class NmeaReplay:
+    """
+    NMEA replay over TCP (asyncio), paced by the DR time of week
+
+    speed: time multiple (2: twice as fast, 0: as fast as the clients read)
+    it starts with the first client, the later clients join the live stream
+    the conversion goes in a thread, REPLAY_QUEUE rows ahead of the replay at most
+    every client has its own queue (REPLAY_CLIENT_QUEUE rows): with speed 0 or only one client
+    the replay waits for the room (the slowest client sets the pace), otherwise the paced
+    replay goes on and the client that far behind is dropped
+    """
+    def __init__(self, epochs, host=REPLAY_HOST, port=REPLAY_PORT, speed=1.0):
+        self.epochs = epochs
+        self.host = host
+        self.port = port
+        self.speed = speed
+        self.aio = lazyImport('asyncio')
+        self.clients = {}
+        self.sent = 0
+        self.stop = False
+
+    async def run(self):
+        aio = self.aio
+        self.loop = aio.get_running_loop()
+        self.queue = aio.Queue(REPLAY_QUEUE)
+        self.first = aio.Event()
+        server = await aio.start_server(self.client, self.host, self.port)
+        async with server:
+            # port 0: the one the system has given
+            self.port = server.sockets[0].getsockname()[1]
+            print(f'NMEA replay on {self.host}:{self.port}, waiting for the client...')
+            await self.first.wait()
+            producer = self.loop.run_in_executor(None, self.produce)
+            try:
+                await self.replay()
+            finally:
+                # the thread stops at the next row when the replay failed (or ctrl-c)
+                self.stop = True
+                while not producer.done():
+                    while not self.queue.empty():
+                        self.queue.get_nowait()
+                    await aio.wait({producer}, timeout=0.1)
+            for q in list(self.clients):
+                await q.put(None)
+            await aio.gather(*self.clients.values(), return_exceptions=True)
+        return self.sent
+
+    def produce(self):
+        # conversion thread: the rows go to the replay queue, it waits while the queue is full
+        try:
+            for e in self.epochs:
+                if self.stop:
+                    break
+                self.aio.run_coroutine_threadsafe(self.queue.put(e), self.loop).result()
+        finally:
+            self.aio.run_coroutine_threadsafe(self.queue.put(None), self.loop).result()
+
+    async def replay(self):
+        t0 = w0 = None
+        while 1:
+            e = await self.queue.get()
+            if e is None:
+                break
+            t, msg = e
+            if self.speed and t is not None:
+                if t0 is None:
+                    t0, w0 = t, self.loop.time()
+                delay = w0 + (t - t0)/self.speed - self.loop.time()
+                if delay > 0:
+                    await self.aio.sleep(delay)
+            await self.broadcast(b''.join(m + REPLAY_EOL for m in msg if m))
+            self.sent += 1
+            if not self.speed:
+                # no pacing, the clients still read in turn
+                await self.aio.sleep(0)
+
+    async def broadcast(self, data):
+        # backpressure: no pacing or one client, wait for the client to read
+        wait = not self.speed or len(self.clients) == 1
+        for q in list(self.clients):
+            if q not in self.clients:
+                # gone while waiting for another client
+                continue
+            if wait:
+                await q.put(data)
+                continue
+            try:
+                q.put_nowait(data)
+            except self.aio.QueueFull:
+                print(f'client {REPLAY_CLIENT_QUEUE} rows behind, dropped')
+                while not q.empty():
+                    q.get_nowait()
+                q.put_nowait(None)
+                del self.clients[q]
+
+    async def client(self, reader, writer):
+        q = self.aio.Queue(REPLAY_CLIENT_QUEUE)
+        self.clients[q] = self.aio.current_task()
+        self.first.set()
+        peer = writer.get_extra_info('peername')
+        print(f'client {peer} connected')
+        try:
+            while 1:
+                data = await q.get()
+                if data is None:
+                    break
+                writer.write(data)
+                # backpressure: the client queue fills up while the socket buffer is full
+                await writer.drain()
+        except (OSError, self.aio.CancelledError):
+            # the client has gone, or the replay is stopped
+            pass
+        finally:
+            self.clients.pop(q, None)
+            # the replay may wait for the room in the queue
+            while not q.empty():
+                q.get_nowait()
+            writer.close()
+            print(f'client {peer} closed')
+
+def replay(p_dr, p_gnss='', n_type='GGA', port=REPLAY_PORT, host=REPLAY_HOST, speed=1.0, tol=None,
+           cache=False, debug=False, start=None, end=None, rate=0):
+    """
+    serve the NMEA sentences over TCP instead of writing the file, see NmeaReplay
+    the rows are converted while the replay goes on
+    port: 0 for any free port, debug: the time tag before each sentence (as convert())
+    start/end/rate: GPS time window and output rate of the DR rows, as convert()
+    returns {'rows': replayed rows, 'stat': DR/GNSS time alignment}, None when failed
+    """
+    global DBG_PRT
+    DBG_PRT = 1 if debug else 0
+    if p_gnss == '':
+        p_gnss = p_dr
+    tList = getTypeList(n_type)
+    if tList == [] or not validPath(p_dr, p_gnss):
+        print(f'please input necessary XLSX file')
+        return None
+    sht_dr, sht_gnss = xlsx2sht(p_dr, p_gnss, cache)
+    if not sht_dr or not sht_gnss:
+        xlsxClose(sht_dr, sht_gnss)
+        return None
+    try:
+        layout = getLayout(sht_dr, sht_gnss, tList)
+        if not layout:
+            return None
+        stat = {}
+        window = (start, end, rate) if start or end or rate else None
+        server = NmeaReplay(nmeaEpochs(sht_dr, sht_gnss, layout, tol, stat, window), host, port, speed)
+        rows = server.aio.run(server.run())
+    except KeyboardInterrupt:
+        print('replay stopped')
+        return None
+    except OSError as e:
+        print(f'replay error: {e}')
+        return None
+    finally:
+        xlsxClose(sht_dr, sht_gnss)
+    print(f'replayed {rows} lines')
+    return {'rows': rows, 'stat': stat}
+
+def getBatchPairs(src):
+    """
+    DR/GNSS xlsx pairs to convert: [(key, dr, gnss), ...]
 
-print('\nXLSX to NMEA Version:',xver)
-while 1:
-    usrinput = input('\nDR.xlsx/GNSS.xlsx,GNSS.xlsx,nmea_type(GGA/RMC/GSV/GSA)'+
-                     '\n(nmea_type: GGA or RMC or GSV or RMC+GSV ...)'+
-                     '\n(GGA is default option)\n'+
-                     '\n[e to exit]: ')
-    i = usrinput.rfind(',')
-    j = usrinput.find(',')
-    if -1 != i and -1 != j and i != j:
-        path_dr = usrinput.partition(',')[0]
-        tmp     = usrinput.partition(',')[2]
-        path_gnss = tmp.partition(',')[0]
-        
-        tmp = tmp.partition(',')[2]
-        i = tmp.find(',')
-        if -1 == i:
-            nmea_type = tmp
-            DBG_PRT = 0
+    src is a directory: the xlsx files are paired by the name, with the
+    'DR'/'GNSS' in the name removed, e.g. run1_DR.xlsx + run1_GNSS.xlsx,
+    a GNSS xlsx without DR is converted alone
+    src is a manifest file: one 'DR.xlsx,GNSS.xlsx' per line (the same as
+    the interactive input), the empty lines and '#' lines are skipped
+    """
+    pairs = []
+    if os.path.isdir(src):
+        dr_dict = {}
+        gnss_dict = {}
+        for f in sorted(os.listdir(src)):
+            name, ext = os.path.splitext(f)
+            if ext.lower() not in XLSX_EXT + ('.xlx',) or f.startswith('~$'):
+                continue
+            for tag, fl_dict in (('GNSS', gnss_dict), ('DR', dr_dict)):
+                i = name.upper().rfind(tag)
+                if i != -1:
+                    key = (name[:i] + name[i+len(tag):]).strip(' _-.') or tag
+                    fl_dict[key] = os.path.join(src, f)
+                    break
+        for key in sorted(set(dr_dict) | set(gnss_dict)):
+            pairs.append((key, dr_dict.get(key, ''), gnss_dict.get(key, '')))
+    else:
+        with open(src, 'rt') as manifest:
+            for line in manifest:
+                line = line.strip()
+                if line == '' or line.startswith('#'):
+                    continue
+                p_dr, _, p_gnss = line.partition(',')
+                p_dr = p_dr.strip()
+                p_gnss = p_gnss.partition(',')[0].strip()
+                key = os.path.splitext(os.path.basename(p_dr or p_gnss))[0]
+                pairs.append((key, p_dr, p_gnss))
+    return pairs
+
+def batchWorker(key, p_dr, p_gnss, n_type, out, compress, tol, cache):
+    # one pair, the console output goes to <out>.log
+    ret = {'key': key, 'dr': p_dr, 'gnss': p_gnss, 'out': out, 'error': ''}
+    if p_gnss == '':
+        ret['error'] = 'GNSS xlsx not found'
+        return ret
+    try:
+        with open(out + '.log', 'wt') as log, contextlib.redirect_stdout(log):
+            res = convert(p_dr or p_gnss, p_gnss, n_type, out, False, compress, tol, 1, cache)
+        if res:
+            ret.update(res)
         else:
-            nmea_type = tmp.partition(',')[0]
-            dbg_flag = tmp.partition(',')[2] 
-            if 'd' == dbg_flag:
-                DBG_PRT = 1
-                print(f'\n---debug mode---\n')
-            else:
+            ret['error'] = 'failed, see ' + out + '.log'
+    except Exception as e:
+        ret['error'] = str(e)
+    return ret
+
+def convertBatch(src, n_type='GGA', out_dir='', jobs=1, compress=None, tol=None, cache=False):
+    """
+    convert all the DR/GNSS pairs in a directory or manifest (see getBatchPairs)
+    jobs pairs are converted at the same time (worker processes)
+    the NMEA files and the summary (BATCH_SUMMARY) are written into out_dir
+    returns [convert() result of each pair + 'key'/'dr'/'gnss'/'error'], None when failed
+    """
+    try:
+        pairs = getBatchPairs(src)
+    except OSError as e:
+        print(f'batch error: {e}')
+        return None
+    if pairs == []:
+        print(f'no xlsx found in {src}')
+        return None
+
+    if out_dir != '':
+        os.makedirs(out_dir, exist_ok=True)
+    print(f'{len(pairs)} pairs to convert')
+    work = [(key, p_dr, p_gnss, n_type,
+             os.path.join(out_dir, key + '-NMEA-v' + str(xver) + '.txt'), compress, tol, cache)
+            for key, p_dr, p_gnss in pairs]
+    if jobs > 1:
+        with lazyImport('concurrent.futures').ProcessPoolExecutor(jobs) as pool:
+            futures = [pool.submit(batchWorker, *w) for w in work]
+            result = []
+            for i, f in enumerate(futures):
+                result.append(f.result())
+                print(f'{i+1}/{len(work)} {result[-1]["key"]}: {result[-1]["error"] or "done"}')
+    else:
+        result = []
+        for i, w in enumerate(work):
+            result.append(batchWorker(*w))
+            print(f'{i+1}/{len(work)} {result[-1]["key"]}: {result[-1]["error"] or "done"}')
+
+    fl_name = os.path.join(out_dir, BATCH_SUMMARY)
+    with open(fl_name, 'wt', newline='') as summary:
+        wr = csv.writer(summary)
+        wr.writerow(['key', 'dr', 'gnss', 'out', 'rows', 'matched', 'mismatched', 'gnss skipped', 'error'])
+        for r in result:
+            stat = r.get('stat', {})
+            wr.writerow([r['key'], r['dr'], r['gnss'], r.get('out', ''), r.get('rows', ''),
+                         stat.get('match', ''), stat.get('mismatch', ''), stat.get('gnss_skip', ''),
+                         r['error']])
+    fail = len([r for r in result if r['error']])
+    print(f'{len(result)-fail} converted, {fail} failed, summary: {fl_name}')
+    return result
+
+def interactive():
+    global DBG_PRT
+    while 1:
+        usrinput = input('\nDR.xlsx/GNSS.xlsx,GNSS.xlsx,nmea_type(GGA/RMC/GSV/GSA)'+
+                         '\n(nmea_type: GGA or RMC or GSV or RMC+GSV ...)'+
+                         '\n(GGA is default option)\n'+
+                         '\n[e to exit]: ')
+        i = usrinput.rfind(',')
+        j = usrinput.find(',')
+        if -1 != i and -1 != j and i != j:
+            path_dr = usrinput.partition(',')[0]
+            tmp     = usrinput.partition(',')[2]
+            path_gnss = tmp.partition(',')[0]
+            
+            tmp = tmp.partition(',')[2]
+            i = tmp.find(',')
+            if -1 == i:
+                nmea_type = tmp
                 DBG_PRT = 0
-                print(f'unaccepted debug flag [{dbg_flag}]')
-        sht2nmea(path_dr, path_gnss, nmea_type)
-    if 'e' == usrinput:
-        # when the file is large, it take quite some time to exit the program
-        # add this 'fake' prompt to let user know the exit process is not hang
-        print('free the allocated memory...')
-        break
+            else:
+                nmea_type = tmp.partition(',')[0]
+                dbg_flag = tmp.partition(',')[2] 
+                if 'd' == dbg_flag:
+                    DBG_PRT = 1
+                    print(f'\n---debug mode---\n')
+                else:
+                    DBG_PRT = 0
+                    print(f'unaccepted debug flag [{dbg_flag}]')
+            sht2nmea(path_dr, path_gnss, nmea_type)
+        if 'e' == usrinput:
+            break
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='Trimble xlsx (DR/GNSS) to NMEA (GGA/RMC/GSV/GSA), '
+                                                 'no argument for the interactive mode')
+    parser.add_argument('--batch', default='', help='directory of DR/GNSS xlsx pairs, or manifest file (DR.xlsx,GNSS.xlsx per line)')
+    parser.add_argument('--outdir', default='', help='batch mode output directory (default: current directory)')
+    parser.add_argument('--dr', default='', help='DR.xlsx (or GNSS.xlsx for GNSS only)')
+    parser.add_argument('--gnss', default='', help='GNSS.xlsx (default: the --dr file)')
+    parser.add_argument('--type', default='GGA', help='GGA/RMC/GSV/GSA joined by +, e.g. GGA+RMC+GSV (default: GGA)')
+    parser.add_argument('--out', default='', help='NMEA file (default: NMEA-v<ver>-<time>.txt)')
+    parser.add_argument('--compress', choices=[c for c in NMEA_COMPRESS_List if c], help='compress the NMEA file')
+    parser.add_argument('--tol', type=float, help=f'DR/GNSS time match tolerance in sec (default: {ALIGN_TOL})')
+    parser.add_argument('--jobs', type=int, default=1, help='worker processes for the conversion, '
+                                                            'pairs at the same time in batch mode (default: 1)')
+    parser.add_argument('--cache', action='store_true', help='keep the parsed xlsx/xlx in <file>.x2n '
+                                                              'for the next conversions')
+    parser.add_argument('--replay', type=int, nargs='?', const=REPLAY_PORT, help=f'serve the NMEA over TCP on this port '
+                        f'instead of the file (default: {REPLAY_PORT})')
+    parser.add_argument('--host', default=REPLAY_HOST, help=f'replay address (default: {REPLAY_HOST})')
+    parser.add_argument('--speed', type=float, default=1.0, help='replay speed, time of week multiple '
+                                                                 '(default: 1, 0: as fast as the clients read)')
+    parser.add_argument('--incremental', action='store_true', help='only add the rows appended since the last run '
+                                                                    'to --out (checkpoint: <out>.ckpt)')
+    parser.add_argument('--start', help='GPS time of the first DR row to convert, WEEK:TOW or TOW (week of the log)')
+    parser.add_argument('--end', help='GPS time of the last DR row to convert, WEEK:TOW or TOW')
+    parser.add_argument('--rate', type=float, default=0, help='output rows per second, e.g. 1 for a 10Hz log '
+                        'to 1Hz NMEA (default: all the rows)')
+    parser.add_argument('--shard-time', type=float, default=0, help='split the NMEA file every SEC of GPS time, '
+                        'e.g. 3600 for one file per hour, with a manifest of the files')
+    parser.add_argument('--shard-size', type=float, default=0, help='split the NMEA file at this size (MB)')
+    parser.add_argument('--pipeline', action='store_true', help='read the xlsx/xlx and write the NMEA in their '
+                        'own threads while converting (network drives, compressed output)')
+    parser.add_argument('--profile', default='', help='JSON file for the time of each stage and the counters')
+    parser.add_argument('--debug', action='store_true', help='debug output (time tag before each sentence)')
+    parser.add_argument('--timing', action='store_true', help='print the startup (import) time at the end')
+    argv = sys.argv[1:] if argv is None else argv
+
+    print('\nXLSX to NMEA Version:',xver)
+    if not argv:
+        interactive()
+        return 0
+
+    args = parser.parse_args(argv)
+    if args.batch != '':
+        ret = convertBatch(args.batch, args.type, args.outdir, args.jobs, args.compress, args.tol, args.cache)
+        ret = ret and not [r for r in ret if r['error']]
+    elif args.dr == '' and args.gnss == '':
+        parser.error('--dr, --gnss or --batch is needed')
+    else:
+        if args.debug:
+            print(f'\n---debug mode---\n')
+        if args.replay is not None:
+            # the NMEA only goes to the clients, the file options are not for the replay
+            file_opt = [opt for opt, used in (('--out', args.out), ('--compress', args.compress),
+                                              ('--jobs', args.jobs != 1), ('--incremental', args.incremental),
+                                              ('--shard-time', args.shard_time), ('--shard-size', args.shard_size),
+                                              ('--pipeline', args.pipeline), ('--profile', args.profile)) if used]
+            if file_opt:
+                parser.error(f"{', '.join(file_opt)} not allowed with --replay")
+            ret = replay(args.dr or args.gnss, args.gnss, args.type, args.replay, args.host, args.speed, args.tol,
+                         args.cache, args.debug, args.start, args.end, args.rate)
+        else:
+            ret = convert(args.dr or args.gnss, args.gnss, args.type, args.out, args.debug, args.compress, args.tol,
+                          args.jobs, args.cache, args.profile, args.incremental, args.start, args.end, args.rate,
+                          args.shard_time, int(args.shard_size*1024*1024), args.pipeline)
+
+    if args.timing:
+        startupReport()
+    return 0 if ret else 1
+
+IMPORT_TIME['xlx2nmea'] = time.perf_counter() - T_START
+
+if __name__ == '__main__':
+    # the worker processes of the "pyinstaller --onefile" EXE start from here as well
+    import multiprocessing
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,267 @@
+# conversion benchmark on synthetic DR/GNSS logs, to track the speed between versions
+# and to size the hardware for big log campaigns
+# python xlx2nmea_bench.py -h for the options
+import os
+import io
+import sys
+import csv
+import time
+import random
+import tempfile
+import contextlib
+
+import xlx2nmea as x
+
+# constellation: (first SV, last SV, first CNO name, second CNO name)
+BENCH_SV_List = [('GPS',     x.GPS_START,     x.GPS_END,     'L1', 'L2'),
+                 ('GLONASS', x.GLONASS_START, x.GLONASS_END, 'G1', 'G2'),
+                 ('SBAS',    x.SBAS_START,    x.SBAS_END,    'L1', 'L5'),
+                 ('GALILEO', x.GALILEO_START, x.GALILEO_END, 'E1', 'E5A'),
+                 ('QZSS',    x.QZSS_START,    x.QZSS_END,    'L1', 'L2'),
+                 ('BEIDOU',  x.BEIDOU_START,  x.BEIDOU_END,  'B1', 'B2I')]
+# single: 'SVnn CNO' (very old format), named: 'SVnn CNO (L1)', dual: 'SVnn CNO (L1)' + 'SVnn CNO (L2)'
+BENCH_CNO_List = ['single', 'named', 'dual']
+
+BENCH_STAGE_List = ['load', 'header', 'GGA', 'RMC', 'GSV/GSA', 'write']
+
+BENCH_DR_TITLE = [x.RMC_9_DR, x.GGA_1_DR, x.GGA_2_DR, x.GGA_4_DR,
+                  x.GGA_9_DR_MSL, x.GGA_11_DR_WGS, x.RMC_7_DR, x.RMC_8_DR]
+BENCH_GNSS_TITLE = BENCH_DR_TITLE + [x.GGA_6_GNSS, x.GGA_7_GNSS, x.GGA_8_GNSS,
+                                     x.GSA_4_GNSS, x.GSA_6_GNSS, x.GGA_13_GNSS]
+
+def benchSVList(svs):
+    # svs SVs of each constellation (limited to its SV numbers)
+    return [(sv, c1, c2) for _, start, end, c1, c2 in BENCH_SV_List
+                         for sv in range(start, min(end, start+svs-1)+1)]
+
+def benchSVTitle(sv, c1, c2, cno):
+    j = str(sv).zfill(2)
+    title = ['SV' + j + ' Used']
+    if cno == 'single':
+        title.append('SV' + j + ' CNO')
+    else:
+        title.append('SV' + j + ' CNO (' + c1 + ')')
+        if cno == 'dual':
+            title.append('SV' + j + ' CNO (' + c2 + ')')
+    return title + ['SV' + j + ' Azim (deg)', 'SV' + j + ' Elev (deg)']
+
+def benchRows(n, dt, gnss, sv_list, cno, na, na_time=0.0, t0=100000.0, week=2200):
+    # the week/time of week are NA at the na_time rate (not the first row), the others at the na rate
+    rnd = random.Random(1 if gnss else 2)
+    def val(v, rate=na):
+        return '=NA()' if rnd.random() < rate else v
+    for i in range(n):
+        tow = round(t0 + i*dt, 3)
+        t_na = na_time if i else 0.0
+        row = [val(week, t_na), val(tow, t_na), val(37.1+i*1e-6), val(-122.3-i*1e-6), val(10.0+i*1e-3), val(40.0+i*1e-3),
+               val(12.3+rnd.random()), val(rnd.uniform(0, 359.9))]
+        if gnss:
+            row += [val(4), val(len(sv_list)), val(round(rnd.uniform(0.6, 1.5), 2)),
+                    val(round(rnd.uniform(1.0, 2.5), 2)), val(round(rnd.uniform(0.8, 2.0), 2)), val(2)]
+            for sv, c1, c2 in sv_list:
+                row.append(int(rnd.random() < 0.8))
+                row.append(val(35+rnd.randint(0, 15)))
+                if cno == 'dual':
+                    row.append(val(30+rnd.randint(0, 15)))
+                row += [val(rnd.randint(0, 359)), val(rnd.randint(5, 89))]
+        yield row
+
+def genLog(p, title, rows, fmt):
+    if fmt == 'xlsx':
+        wb = x.lazyImport('openpyxl').Workbook(write_only=True)
+        ws = wb.create_sheet()
+        ws.append(title)
+        for row in rows:
+            ws.append(row)
+        wb.save(p)
+    else:
+        # Trimble xlx: tab delimited text
+        with open(p, 'wt', newline='') as f:
+            wr = csv.writer(f, delimiter='\t', lineterminator='\n')
+            wr.writerow(title)
+            wr.writerows(rows)
+
+def genBench(out_dir, rows=20000, ratio=2, svs=8, cno='dual', na=0.01, fmt='xlx', na_time=0.001):
+    """
+    synthetic DR/GNSS logs with the Trimble title names, -> (DR file, GNSS file)
+
+    rows: DR rows (20Hz), ratio: DR/GNSS rate (2: 10Hz GNSS)
+    svs: SVs of each constellation, cno: see BENCH_CNO_List
+    na: rate of the NA cells (all but the week/time of week)
+    na_time: rate of the NA week/time of week cells
+    """
+    sv_list = benchSVList(svs)
+    gnss_title = list(BENCH_GNSS_TITLE)
+    for sv, c1, c2 in sv_list:
+        gnss_title += benchSVTitle(sv, c1, c2, cno)
+    p_dr = os.path.join(out_dir, 'bench_DR.' + fmt)
+    p_gnss = os.path.join(out_dir, 'bench_GNSS.' + fmt)
+    genLog(p_dr, BENCH_DR_TITLE, benchRows(rows, 0.05, False, sv_list, cno, na, na_time), fmt)
+    genLog(p_gnss, gnss_title, benchRows(max(1, int(rows/ratio)), 0.05*ratio, True, sv_list, cno, na, na_time), fmt)
+    return p_dr, p_gnss
+
+class StageTimer:
+    # wall-clock seconds of each stage, added up
+    def __init__(self):
+        self.t = dict.fromkeys(BENCH_STAGE_List, 0.0)
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.t[name] += time.perf_counter() - t
+
+def benchStages(p_dr, p_gnss, out):
+    """
+    one GGA+RMC+GSV+GSA conversion, stage by stage -> {stage: sec}, DR rows, NMEA bytes
+
+    the stages run one after the other on the whole log (convertSht() streams
+    them chunk by chunk), so each one can be timed on its own
+    """
+    tm = StageTimer()
+    quiet = contextlib.redirect_stdout(io.StringIO())
+    with tm.stage('load'):
+        sht_dr, sht_gnss = x.openSht(p_dr), x.openSht(p_gnss)
+        dr_chunks = list(x.rowChunks(sht_dr.rows(), x.CHUNK_ROW))
+        gnss_rows = list(sht_gnss.rows())
+
+    with tm.stage('header'), quiet:
+        layout = x.getLayout(sht_dr, sht_gnss, ['GGA', 'RMC', 'GSV', 'GSA'])
+    x.xlsxClose(sht_dr, sht_gnss)
+    if not layout or layout.gnss_ret != 1:
+        raise ValueError('synthetic log not accepted, see xlx2nmea output')
+    gga, rmc = layout.gga, layout.rmc
+
+    # GGA: DR/GNSS time alignment, columns and UTC, sentences
+    chunks = []
+    gga_msg = []
+    with tm.stage('GGA'):
+        align = x.TimeAlign(iter(gnss_rows), gga)
+        for dr_chunk in dr_chunks:
+            gnss_chunk, gnss_j = align.align(dr_chunk)
+            dr = x.ColChunk(dr_chunk, layout.dr_col)
+            gn = x.ColChunk(gnss_chunk, layout.gnss_col)
+            gga_utc = x.getUTCtagList(dr.col[gga.week], dr.col[gga.tow], dr.na[gga.week], dr.na[gga.tow])
+            gga_lat = x.getPosList(1, dr.col[gga.lat], dr.na[gga.lat])
+            gga_lon = x.getPosList(0, dr.col[gga.lon], dr.na[gga.lon])
+            for k in range(dr.len):
+                gga_msg.append(x.msgGGA(dr, k, gn, gnss_j[k], gga, gga_utc[k][0], gga_lat[k], gga_lon[k]))
+            chunks.append((gn, gnss_j))
+
+    rmc_msg = []
+    with tm.stage('RMC'):
+        for gn, gnss_j in chunks:
+            rmc_utc = x.getUTCtagList(gn.col[rmc.week], gn.col[rmc.tow], gn.na[rmc.week], gn.na[rmc.tow])
+            rmc_lat = x.getPosList(1, gn.col[rmc.lat], gn.na[rmc.lat])
+            rmc_lon = x.getPosList(0, gn.col[rmc.lon], gn.na[rmc.lon])
+            for j in gnss_j:
+                if j >= 0:
+                    rmc_msg.append(x.msgRMC(gn, j, rmc, rmc_utc[j], rmc_lat[j], rmc_lon[j]))
+
+    gsv_msg = []
+    with tm.stage('GSV/GSA'):
+        for gn, gnss_j in chunks:
+            for j in gnss_j:
+                if j >= 0:
+                    x.msgGSVandGSA(gsv_msg, layout.gsa, layout.gsv, gn, j)
+
+    with tm.stage('write'):
+        with x.NmeaWriter(out) as nmea_log:
+            for msg in (gga_msg, rmc_msg, gsv_msg):
+                x.msgLstWrNMEA([m for m in msg if m], nmea_log)
+    return tm.t, sum(len(c) for c in dr_chunks), os.path.getsize(out)
+
+def benchConvert(p_dr, p_gnss, out, jobs=1):
+    # the whole convert(), as the users run it
+    t = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        res = x.convert(p_dr, p_gnss, 'GGA+RMC+GSV+GSA', out, jobs=jobs)
+    if not res:
+        raise ValueError('convert failed')
+    return time.perf_counter() - t
+
+def runBench(rows=20000, ratio=2, svs=8, cno='dual', na=0.01, fmt='xlx', repeat=3, jobs=1, keep='',
+             layout_cache=False, na_time=0.001):
+    """
+    -> {'rows', ..., stage: best sec of the repeats, 'convert': best sec of convert()}
+    keep: directory for the synthetic logs and NMEA files, '' for a temporary one
+    layout_cache: use the column layout cache (x.LAYOUT_CACHE), off by default so the
+    header stage times the header search of every repeat and ~/.xlx2nmea is not written
+    """
+    layout_file = x.LAYOUT_CACHE
+    if not layout_cache:
+        x.LAYOUT_CACHE = ''
+    try:
+        return benchRepeat(rows, ratio, svs, cno, na, fmt, repeat, jobs, keep, na_time)
+    finally:
+        x.LAYOUT_CACHE = layout_file
+
+def benchRepeat(rows, ratio, svs, cno, na, fmt, repeat, jobs, keep, na_time):
+    with tempfile.TemporaryDirectory() as tmp:
+        out_dir = keep or tmp
+        if keep:
+            os.makedirs(keep, exist_ok=True)
+        p_dr, p_gnss = genBench(out_dir, rows, ratio, svs, cno, na, fmt, na_time)
+        out = os.path.join(out_dir, 'bench.nmea')
+        res = {'version': x.xver, 'format': fmt, 'rows': rows, 'ratio': ratio, 'svs': svs,
+               'cno': cno, 'na': na, 'na_time': na_time, 'jobs': jobs}
+        best = dict.fromkeys(BENCH_STAGE_List + ['convert'], None)
+        for _ in range(repeat):
+            stage_t, dr_rows, nmea_size = benchStages(p_dr, p_gnss, out)
+            stage_t['convert'] = benchConvert(p_dr, p_gnss, out, jobs)
+            for k, t in stage_t.items():
+                if best[k] is None or t < best[k]:
+                    best[k] = t
+        res.update(best)
+        res['nmea_bytes'] = nmea_size
+        res['rows_per_sec'] = round(dr_rows / best['convert'])
+    return res
+
+def benchReport(res):
+    print(f"{res['rows']} DR rows ({res['format']}), DR/GNSS rate {res['ratio']}, "
+          f"{res['svs']} SVs/constellation, CNO {res['cno']}, NA {res['na']} "
+          f"(time {res['na_time']})")
+    for k in BENCH_STAGE_List + ['convert']:
+        print(f'  {k:8s} {res[k]*1000:10.1f} ms')
+    print(f"  {res['rows_per_sec']} rows/s, {res['nmea_bytes']} NMEA bytes")
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='xlx2nmea benchmark on synthetic DR/GNSS logs')
+    parser.add_argument('--rows', type=int, default=20000, help='DR rows (default: 20000)')
+    parser.add_argument('--ratio', type=float, default=2, help='DR/GNSS rate ratio (default: 2, 20Hz DR/10Hz GNSS)')
+    parser.add_argument('--svs', type=int, default=8, help='SVs of each constellation (default: 8)')
+    parser.add_argument('--cno', choices=BENCH_CNO_List, default='dual', help='CNO titles (default: dual)')
+    parser.add_argument('--na', type=float, default=0.01, help='rate of the NA cells (default: 0.01)')
+    parser.add_argument('--na-time', type=float, default=0.001,
+                        help='rate of the NA week/time of week cells (default: 0.001)')
+    parser.add_argument('--format', choices=['xlx', 'xlsx'], default='xlx', help='log format (default: xlx)')
+    parser.add_argument('--repeat', type=int, default=3, help='runs, the best one is taken (default: 3)')
+    parser.add_argument('--jobs', type=int, default=1, help='convert() worker processes (default: 1)')
+    parser.add_argument('--keep', default='', help='keep the synthetic logs in this directory')
+    parser.add_argument('--layout-cache', action='store_true',
+                        help='use the column layout cache (default: off, the header search is timed)')
+    parser.add_argument('--csv', default='', help='add the result to this csv file, to track it between versions')
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+    res = runBench(args.rows, args.ratio, args.svs, args.cno, args.na, args.format,
+                   args.repeat, args.jobs, args.keep, args.layout_cache, args.na_time)
+    benchReport(res)
+    if args.csv != '':
+        new = not os.path.exists(args.csv)
+        fields = list(res)
+        if not new:
+            # the columns of the file, a csv from an older version may miss the new ones
+            with open(args.csv, 'rt', newline='') as f:
+                fields = next(csv.reader(f), fields)
+        with open(args.csv, 'at', newline='') as f:
+            wr = csv.DictWriter(f, fieldnames=fields, restval='', extrasaction='ignore')
+            if new:
+                wr.writeheader()
+            wr.writerow(res)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
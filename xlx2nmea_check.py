@@ -0,0 +1,373 @@
+# NMEA output validator and differ: checksums, GSV sequences, GGA/RMC time order,
+# and the changed fields epoch by epoch between two outputs (e.g. two xlx2nmea versions)
+# python xlx2nmea_check.py -h for the options
+import os
+import sys
+from collections import Counter
+
+import xlx2nmea as x
+
+# read block (bytes), the checksums of a block are done at once (see chkSumList)
+CHECK_BLOCK = 4*1024*1024
+# sentence bodies are padded for the checksum up to this width, the longer ones are done one by one
+CHECK_WIDTH = 256
+# issues/epoch diffs printed (the counters have them all)
+CHECK_MAX_PRT = 20
+# a time going back more than this (ms) is the next UTC day, less is out of order
+CHECK_DAY_WRAP = 12*3600*1000
+
+# '7C'/'7c' -> 0x7C
+HEX_VAL = dict([(h, i) for i, h in enumerate(x.HEX_List)] + [(h.lower(), i) for i, h in enumerate(x.HEX_List)])
+
+def nmeaFiles(p):
+    # NMEA file, or the files of a shard manifest (see xlx2nmea.ShardWriter) in order
+    if not p.endswith(x.SHARD_MANIFEST):
+        return [p]
+    with open(p, 'rt') as f:
+        manifest = x.lazyImport('json').load(f)
+    return [os.path.join(os.path.dirname(p), shard['file']) for shard in manifest['shards']]
+
+def openNmea(p):
+    for compress in x.NMEA_COMPRESS_List:
+        if compress and p.endswith('.' + compress):
+            return x.NMEA_COMPRESS_List[compress](p, 'rb')
+    return open(p, 'rb')
+
+def nmeaBlocks(p, size=CHECK_BLOCK):
+    # -> [line, ...] (bytes, no line end) of each block of the NMEA file(s)
+    for fl_name in nmeaFiles(p):
+        with openNmea(fl_name) as f:
+            rest = b''
+            while 1:
+                data = f.read(size)
+                if not data:
+                    break
+                lines = (rest + data).split(b'\n')
+                rest = lines.pop()
+                yield lines
+            if rest:
+                yield [rest]
+
+def chkSumList(bodies, max_width=CHECK_WIDTH):
+    """
+    NMEA checksum (XOR of the bytes) of each sentence body -> bytearray
+    all the bodies at once: they are zero padded (0 doesn't change the XOR) to the same width,
+    then the k-th bytes of all of them (data[k::width]) are XORed as one big int, for each k
+    """
+    n = len(bodies)
+    if n == 0:
+        return bytearray()
+    width = min(max(map(len, bodies)), max_width)
+    data = b''.join([b.ljust(width, b'\0') if len(b) <= width else bytes(width) for b in bodies])
+    v = 0
+    for k in range(width):
+        v ^= int.from_bytes(data[k::width], 'little')
+    sums = bytearray(v.to_bytes(n, 'little'))
+    for i, b in enumerate(bodies):
+        if len(b) > width:
+            sums[i] = x.GenChkSum(b)
+    return sums
+
+def timeMs(v):
+    # hhmmss.sss -> ms of the day, None when there is no time
+    try:
+        return (int(v[0:2])*3600 + int(v[2:4])*60)*1000 + round(float(v[4:])*1000)
+    except (ValueError, IndexError):
+        return None
+
+def keyStr(key):
+    # epoch key -> hh:mm:ss.sss (+day)
+    if key is None:
+        return '-'
+    day, ms = key
+    sec, ms = divmod(ms, 1000)
+    hour, sec = divmod(sec, 3600)
+    minute, sec = divmod(sec, 60)
+    return f'{hour:02}:{minute:02}:{sec:02}.{ms:03}' + (f' (+{day}d)' if day else '')
+
+class NmeaCheck:
+    """
+    streaming check of an NMEA file (or shard manifest), epochs() yields the epochs
+    (key (day, UTC ms), [sentence bodies without '$'/checksum]) while it checks the lines
+
+    an epoch starts at each GGA, or an RMC with another time (RMC only output)
+    issues: format (no '$'/'*hh'), checksum, gsv (GSV sequence: message numbers, SV count),
+    time (RMC time not the GGA time), order (time going back, sentence before the first GGA/RMC)
+    """
+    def __init__(self, p, max_prt=CHECK_MAX_PRT):
+        self.p = p
+        self.max_prt = max_prt
+        self.lines = 0
+        self.sentences = Counter()
+        self.epoch_num = 0
+        self.err = Counter()
+        self.issues = []
+        # the current epoch and GSV sequence
+        self.key = None
+        self.epoch = None
+        self.ms = None
+        self.day = 0
+        self.has_gga = False
+        self.gsv = None
+
+    def issue(self, kind, line_no, text):
+        self.err[kind] += 1
+        if len(self.issues) < self.max_prt:
+            self.issues.append((line_no, kind, text))
+
+    def epochs(self):
+        line_no = 0
+        for lines in nmeaBlocks(self.p):
+            # $body*hh in the block at once, then the other lines one by one
+            bodies = [line[1:-3] for line in lines]
+            sums = [HEX_VAL.get(line[-2:]) if line[:1] == b'$' and line[-3:-2] == b'*' else None for line in lines]
+            if None in sums:
+                self.lineFormat(lines, bodies, sums, line_no)
+            for body, cs, got in zip(bodies, sums, chkSumList(bodies)):
+                line_no += 1
+                if cs is None:
+                    continue
+                if got != cs:
+                    self.issue('checksum', line_no, f'{body[:5].decode("utf-8", "replace")}: *{cs:02X}, '
+                                                    f'should be *{got:02X}')
+                epoch = self.sentence(body, line_no)
+                if epoch:
+                    yield epoch
+            self.lines = line_no
+        if self.gsv:
+            self.issue('gsv', line_no, f'{self.gsv[0].decode()}GSV: last sequence not complete')
+        if self.epoch:
+            self.epoch_num += 1
+            yield self.key, self.epoch
+
+    def lineFormat(self, lines, bodies, sums, line_no):
+        # the lines not in $body*hh: '\r' line end, time tag before '$' (debug output), or not NMEA
+        for k, line in enumerate(lines):
+            if sums[k] is not None:
+                continue
+            if line.endswith(b'\r'):
+                line = line[:-1]
+            bodies[k] = b''
+            if not line:
+                continue
+            i = line.find(b'$')
+            s = line.rfind(b'*')
+            cs = HEX_VAL.get(line[s+1:]) if 0 <= i < s else None
+            if cs is None:
+                self.issue('format', line_no+k+1, line[:80].decode('utf-8', 'replace'))
+                continue
+            bodies[k] = line[i+1:s]
+            sums[k] = cs
+
+    def sentence(self, body, n):
+        # -> the epoch before when this one starts a new epoch
+        # bytes, only decoded for the issues
+        typ = body[2:5]
+        self.sentences[typ] += 1
+        gsv = self.gsv
+        if gsv and (typ != b'GSV' or body[:2] != gsv[0]):
+            self.issue('gsv', n, f'{gsv[0].decode()}GSV: sequence ends at message {gsv[2]} of {gsv[1]}')
+            self.gsv = None
+        done = None
+        if typ == b'GGA' or typ == b'RMC':
+            f = body.split(b',', 2)
+            ms = timeMs(f[1]) if len(f) > 1 else None
+            if typ == b'GGA':
+                self.has_gga = True
+                new = True
+            else:
+                new = self.epoch is None or ms != self.ms
+                if new and self.has_gga:
+                    self.issue('time', n, f'RMC {keyStr((0, ms)) if ms is not None else "-"}, '
+                                          f'GGA {keyStr((0, self.ms)) if self.ms is not None else "-"}')
+            if new:
+                if self.epoch:
+                    self.epoch_num += 1
+                    done = (self.key, self.epoch)
+                self.newEpoch(ms, n, body)
+                self.epoch = []
+        elif typ == b'GSV':
+            self.checkGSV(body[:2], body, n)
+        if self.epoch is None:
+            self.issue('order', n, f'{body[:5].decode("utf-8", "replace")} before the first GGA/RMC')
+        else:
+            self.epoch.append(body)
+        return done
+
+    def newEpoch(self, ms, n, body):
+        # the key of the epoch starting at a GGA/RMC of ms (None: no time, the key before is kept)
+        if ms is None:
+            return
+        if self.ms is not None and ms < self.ms:
+            if self.ms - ms > CHECK_DAY_WRAP:
+                self.day += 1
+            else:
+                self.issue('order', n, f'{body[:5].decode("utf-8", "replace")} {keyStr((0, ms))} '
+                                       f'after {keyStr((0, self.ms))}')
+        self.ms = ms
+        self.key = (self.day, ms)
+
+    def checkGSV(self, talker, body, n):
+        # [talker, messages, next message, SVs, SVs so far]
+        f = body.split(b',')
+        talker_b = talker
+        talker = talker.decode('utf-8', 'replace')
+        try:
+            total, num, svs = int(f[1]), int(f[2]), int(f[3])
+        except (ValueError, IndexError):
+            self.issue('gsv', n, f'{talker}GSV: no message/SV numbers')
+            self.gsv = None
+            return
+        # the SV fields: xlx2nmea (GSV_SUBELEM_NUM each) or the standard 4 (SV, elevation, azimuth, CNO)
+        sv_fields = len(f) - 4
+        for width in (x.GSV_SUBELEM_NUM, 4):
+            if sv_fields % width == 0:
+                break
+        else:
+            self.issue('gsv', n, f'{talker}GSV: {sv_fields} SV fields')
+        sv_n = sv_fields//width
+        gsv = self.gsv
+        if num == 1:
+            if gsv:
+                self.issue('gsv', n, f'{talker}GSV: new sequence at message {gsv[2]} of {gsv[1]}')
+            gsv = self.gsv = [talker_b, total, 1, svs, 0]
+        elif not gsv or num != gsv[2] + 1 or total != gsv[1] or svs != gsv[3]:
+            self.issue('gsv', n, f'{talker}GSV: message {num} of {total} out of sequence')
+            self.gsv = None
+            return
+        gsv[2] = num
+        gsv[4] += sv_n
+        if num > total:
+            self.issue('gsv', n, f'{talker}GSV: message {num} of {total}')
+            self.gsv = None
+        elif num == total:
+            if gsv[4] != svs:
+                self.issue('gsv', n, f'{talker}GSV: {gsv[4]} SVs in the sequence, {svs} in the count')
+            self.gsv = None
+
+    def report(self):
+        print(f'{self.p}: {self.lines} lines, {self.epoch_num} epochs, '
+              + ', '.join(f'{t.decode("utf-8", "replace")} {c}' for t, c in sorted(self.sentences.items())))
+        if not self.err:
+            print('  no issue')
+            return
+        print('  issues: ' + ', '.join(f'{k} {c}' for k, c in sorted(self.err.items())))
+        for line_no, kind, text in self.issues:
+            print(f'  line {line_no}: {kind}: {text}')
+
+def fieldEqual(a, b, tol):
+    # the same text, or the same number within tol (3706.0 and 3706.00000000), tol None: text only
+    if a == b:
+        return True
+    if a is None or b is None or tol is None:
+        return False
+    try:
+        return abs(float(a) - float(b)) <= tol
+    except ValueError:
+        return False
+
+def sentenceFields(epoch):
+    # {GPGGA: fields, GPGSV: fields, GPGSV#2: ..., } of an epoch, in the order
+    fields = {}
+    seen = Counter()
+    for body in epoch:
+        f = body.split(b',')
+        name = f[0].decode('utf-8', 'replace')
+        seen[name] += 1
+        fields[name if seen[name] == 1 else f'{name}#{seen[name]}'] = f
+    return fields
+
+def epochDiff(ea, eb, tol=0.0):
+    # -> [(sentence, field number (None: the sentence is only in one), a, b), ...], tol: see fieldEqual
+    fa = sentenceFields(ea)
+    fb = sentenceFields(eb)
+    diff = []
+    for name in list(fa) + [n for n in fb if n not in fa]:
+        a = fa.get(name)
+        b = fb.get(name)
+        if a is None or b is None:
+            diff.append((name, None, a and b','.join(a), b and b','.join(b)))
+            continue
+        for i in range(1, max(len(a), len(b))):
+            va = a[i] if i < len(a) else None
+            vb = b[i] if i < len(b) else None
+            if not fieldEqual(va, vb, tol):
+                diff.append((name, i, va, vb))
+    return diff
+
+def diffNmea(check_a, check_b, tol=0.0, max_prt=CHECK_MAX_PRT):
+    """
+    epoch by epoch diff of two NMEA files (NmeaCheck), the epochs are matched by the UTC time
+    -> {'same', 'changed', 'only_a', 'only_b': epochs, 'fields': {(sentence, field): changes},
+        'diffs': [(key, epochDiff), ...] (max_prt of them)}
+    """
+    res = {'same': 0, 'changed': 0, 'only_a': 0, 'only_b': 0, 'fields': Counter(), 'diffs': []}
+    ia = check_a.epochs()
+    ib = check_b.epochs()
+    a = next(ia, None)
+    b = next(ib, None)
+    while a or b:
+        if b is None or (a and a[0] is not None and b[0] is not None and a[0] < b[0]):
+            res['only_a'] += 1
+            a = next(ia, None)
+            continue
+        if a is None or (a[0] is not None and b[0] is not None and b[0] < a[0]):
+            res['only_b'] += 1
+            b = next(ib, None)
+            continue
+        diff = [] if a[1] == b[1] else epochDiff(a[1], b[1], tol)
+        if diff:
+            res['changed'] += 1
+            for name, i, _, _ in diff:
+                # GPGSV#2 field 5 -> GPGSV field 5
+                res['fields'][(name.split('#')[0], i)] += 1
+            if len(res['diffs']) < max_prt:
+                res['diffs'].append((a[0], diff))
+        else:
+            res['same'] += 1
+        a = next(ia, None)
+        b = next(ib, None)
+    return res
+
+def diffReport(res):
+    print(f"diff: {res['same']} epochs the same, {res['changed']} changed, "
+          f"{res['only_a']} only in A, {res['only_b']} only in B")
+    for (name, i), c in sorted(res['fields'].items(), key=lambda kv: -kv[1]):
+        print(f'  {name} ' + (f'field {i}' if i is not None else 'sentence') + f': {c} epochs')
+    for key, diff in res['diffs']:
+        print(f'  {keyStr(key)}:')
+        for name, i, a, b in diff:
+            a = a.decode('utf-8', 'replace') if a is not None else '-'
+            b = b.decode('utf-8', 'replace') if b is not None else '-'
+            print(f'    {name} ' + (f'field {i}' if i is not None else 'sentence') + f': {a} -> {b}')
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='check an xlx2nmea NMEA file, or diff two of them by epoch')
+    parser.add_argument('nmea', nargs='+', help='NMEA file (.gz/.xz, or a shard .manifest.json), '
+                        'a second one to diff with it (A B)')
+    parser.add_argument('--tol', type=float, default=0.0, help='numeric fields within this are the same '
+                        '(default: 0, the same number in any format)')
+    parser.add_argument('--text', action='store_true', help='compare the fields as text (3706.0 is not 3706.00)')
+    parser.add_argument('--max', type=int, default=CHECK_MAX_PRT, help=f'issues/epoch diffs printed '
+                        f'(default: {CHECK_MAX_PRT})')
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+    if len(args.nmea) > 2:
+        parser.error('one NMEA file to check, or two to diff')
+
+    checks = [NmeaCheck(p, args.max) for p in args.nmea]
+    changed = 0
+    if len(checks) == 1:
+        for _ in checks[0].epochs():
+            pass
+    else:
+        res = diffNmea(checks[0], checks[1], None if args.text else args.tol, args.max)
+        changed = res['changed'] + res['only_a'] + res['only_b']
+    for check in checks:
+        check.report()
+    if len(checks) == 2:
+        diffReport(res)
+    return 1 if changed or any(check.err for check in checks) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())